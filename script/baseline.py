@@ -0,0 +1,55 @@
+"""Saved baselines for the benchmark scripts: command-line options, saving, and comparison with a tolerance."""
+
+import sys
+import json
+
+
+def add_baseline_args(parser):
+    """Add --save-baseline, --compare and --tolerance to a benchmark's argument parser."""
+    parser.add_argument("--save-baseline", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Compare against a baseline JSON file and exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown relative to the baseline.")
+
+
+def compare(results, baseline, tolerance, unit, width=48):
+    """
+    Print the ratio of each result to the baseline and return the names of cases slower than `1 + tolerance` times it.
+
+    Cases missing from the baseline are skipped.
+    """
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        ratio = value / baseline[name]
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<{width}} {baseline[name]:>12.1f} -> {value:>12.1f} {unit}  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def check_baseline(args, results, unit, names=None, width=48):
+    """
+    Save `results` to `args.save_baseline` and compare them with `args.compare`, when those options are set.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments, with the options of `add_baseline_args`.
+        results (Dict[str, float]): Timings keyed by case name; all of them are saved.
+        unit (str): Unit of the timings, for the printed comparison.
+        names (List[str], optional): Cases to compare. Defaults to every case.
+        width (int): Width of the case name column.
+
+    Returns:
+        List[str]: Names of the cases slower than the baseline by more than `args.tolerance`.
+    """
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"python": sys.version, "args": vars(args), "results": results}, f, indent=4)
+    if not args.compare:
+        return []
+    with open(args.compare) as f:
+        baseline = json.load(f)["results"]
+    compared = results if names is None else {name: results[name] for name in names}
+    return compare(compared, baseline, args.tolerance, unit, width)
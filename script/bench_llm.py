@@ -0,0 +1,104 @@
+"""Offline load benchmark of the inference path (`llm_generate`) against the local mock server."""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import src.llm.call as call
+from src.llm.cache import ResponseCache, set_response_cache
+from src.llm.pool import Endpoint, EndpointPool
+from src.llm.rate_limit import configure_rate_limit
+from src.llm.telemetry import Telemetry
+from src.llm.mock_server import MockChatServer, add_config_arguments, config_from_args
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark llm_generate against a local mock OpenAI-compatible server.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="Concurrency settings to benchmark.")
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests per setting.")
+    parser.add_argument("--prompt-chars", type=int, default=4000, help="Mean prompt size in characters.")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of requests repeating an earlier prompt (cache hits).")
+    parser.add_argument("--schedule", choices=["longest_first", "fifo"], default="longest_first")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic workload.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this path.")
+    add_config_arguments(parser)
+    return parser.parse_args()
+
+
+def make_inputs(count, prompt_chars, duplicate_rate, seed):
+    """Synthetic requests with prompt sizes spread around `prompt_chars`; some repeat earlier prompts."""
+    rng = random.Random(seed)
+    inputs = []
+    for i in range(count):
+        if inputs and rng.random() < duplicate_rate:
+            inputs.append(rng.choice(inputs))
+            continue
+        size = max(1, int(rng.uniform(0.5, 1.5) * prompt_chars))
+        user_message = f"request {i}: " + "x" * size
+        inputs.append({"system_prompt": "You are a helpful assistant.", "user_message": user_message, "token_length": len(user_message) // 4})
+    return inputs
+
+
+def run_setting(call, server, inputs, max_workers, schedule, cache_dir):
+    """Run one benchmark setting with a fresh response cache and rate limiter."""
+    model = "mock-model"
+    configure_rate_limit(model, max_concurrency=max_workers)
+    set_response_cache(ResponseCache(os.path.join(cache_dir, f"responses_{max_workers}.sqlite")))
+    server.reset_stats()
+
+    telemetry = Telemetry(window=len(inputs))
+    start = time.perf_counter()
+    call.llm_generate(inputs, model=model, mute_tqdm=True, max_workers=max_workers, schedule=schedule, telemetry=telemetry)
+    elapsed = time.perf_counter() - start
+
+    stats = dict(server.stats)
+    summary = telemetry.aggregates()[model]
+    return {
+        "max_workers": max_workers,
+        "requests": len(inputs),
+        "seconds": elapsed,
+        "requests_per_second": len(inputs) / elapsed,
+        "p50_ms": (summary["latency_p50_seconds"] or 0.0) * 1000.0,
+        "p95_ms": (summary["latency_p95_seconds"] or 0.0) * 1000.0,
+        "p99_ms": (summary["latency_p99_seconds"] or 0.0) * 1000.0,
+        "mean_queue_wait_ms": summary["mean_queue_wait_seconds"] * 1000.0,
+        "server_requests": stats["requests"],
+        "retries": summary["retries"],
+        "retry_causes": summary["retry_causes"],
+        "throttled": stats.get("429", 0),
+        "server_errors": sum(count for name, count in stats.items() if name.startswith("5")),
+        "cache_hit_rate": summary["cache_hit_rate"],
+    }
+
+
+def main():
+    """Main function to run the benchmark."""
+    args = parse_args()
+    with MockChatServer(config_from_args(args)) as server:
+        # Only the mock server, whatever endpoints the environment configures
+        call.set_pool(EndpointPool([Endpoint("mock", base_url=server.base_url, api_key="mock")]))
+
+        inputs = make_inputs(args.requests, args.prompt_chars, args.duplicate_rate, args.seed)
+        results = []
+        with tempfile.TemporaryDirectory() as cache_dir:
+            print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'retries':>7} {'429':>5} {'5xx':>5} {'hit rate':>8}")
+            for max_workers in args.workers:
+                result = run_setting(call, server, inputs, max_workers, args.schedule, cache_dir)
+                results.append(result)
+                print(
+                    f"{max_workers:>7} {result['requests_per_second']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                    f"{result['p99_ms']:>8.1f} {result['retries']:>7} {result['throttled']:>5} {result['server_errors']:>5} "
+                    f"{result['cache_hit_rate']:>8.1%}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
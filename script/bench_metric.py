@@ -0,0 +1,193 @@
+"""Benchmark the task metrics on synthetic LongPiBench-shaped workloads, with saved baselines for regression checks."""
+
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from src.metric.code_completion import CompletionMetric, _load_library_names
+from src.metric.expected_output import ExpectedOutputStore
+from src.metric.table_sql import SQLMetric
+from src.metric.history_reorder import HistoryReorderMetric
+from src.metric.wiki_retrieval import WikiQAMetric
+from script.baseline import add_baseline_args, check_baseline
+
+NAMES = ["Zhao Wei", "Wang Fang", "Li Na", "Zhou Wei", "He Wei", "Huang Wei", "Xu Wei", "Sun Wei", "Chen Wei", "Ma Wei"]
+COUNTRIES = ["China", "India", "Brazil", "France", "Kenya", "Japan", "Mexico", "Egypt"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+WORDS = ["river", "ancient", "policy", "signal", "harbor", "crystal", "ledger", "monsoon", "archive", "lantern", "summit", "orbit"]
+
+
+def _table_row(rng, country=None):
+    return (
+        f"| {country or rng.choice(COUNTRIES)} | {rng.choice(NAMES)} | {rng.randint(1950, 2020)} "
+        f"| {rng.choice(MONTHS)} | {rng.choice(['A', 'B', 'AB', 'O'])} |"
+    )
+
+
+def _filler(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def make_sql_workload(pairs, size, rng):
+    """Table-row labels; responses list some of them among other rows, padded to about `size` characters."""
+    responses, labels = [], []
+    for _ in range(pairs):
+        country = rng.choice(COUNTRIES)
+        answers = [_table_row(rng, country) for _ in range(10)]
+        rows = rng.sample(answers, rng.randint(0, 10))
+        response = []
+        length = 0
+        while length < size:
+            row = rows.pop() if rows and rng.random() < 0.2 else _table_row(rng, country)
+            response.append(f"'{row}'")
+            length += len(row) + 4
+        responses.append("Here are the matching entries:\n\n[" + ", ".join(response) + "]")
+        labels.append(answers)
+    return responses, labels, [{} for _ in range(pairs)]
+
+
+def make_wiki_workload(pairs, size, rng):
+    """Short topic labels; responses mention some of them inside about `size` characters of prose."""
+    responses, labels = [], []
+    for _ in range(pairs):
+        topics = [" ".join(rng.sample(WORDS, 2)).title() for _ in range(rng.randint(1, 10))]
+        text = _filler(rng, size).split(" ")
+        for topic in rng.sample(topics, rng.randint(0, len(topics))):
+            text.insert(rng.randrange(len(text) + 1), topic)
+        responses.append(" ".join(text))
+        labels.append(topics)
+    return responses, labels, [{} for _ in range(pairs)]
+
+
+def make_history_workload(pairs, size, rng):
+    """Ten-event queries with a ground-truth order; responses list the events in a shuffled order, padded to `size`."""
+    responses, labels, extra_kwargs = [], [], []
+    for _ in range(pairs):
+        events = [f"The {' '.join(rng.sample(WORDS, 3))} event number {rng.randint(0, 10 ** 6)}." for _ in range(10)]
+        query = "; ".join(f"{i}: {event}" for i, event in enumerate(events))
+        order = list(range(10))
+        rng.shuffle(order)
+        predicted = order[:]
+        rng.shuffle(predicted)
+        listing = ";\n".join(f"{i}: {events[i]}" for i in predicted)
+        responses.append(_filler(rng, max(0, size - len(listing)) // 2) + "\n[" + listing + "]\n" + _filler(rng, max(0, size - len(listing)) // 2))
+        labels.append([", ".join(str(i) for i in order)])
+        extra_kwargs.append({"query": query})
+    return responses, labels, extra_kwargs
+
+
+_COMPLETION_PROGRAM = """import re
+
+text = 'There are {a} apples and {b} oranges.'
+print(re.sub(r'\\d+', 'NUM', text))
+print(re.findall(r'\\d+', text))
+print(re.split(',', 'Split,this,{c},by,commas.'))
+print(re.escape('[].*?{c}'))
+"""
+
+
+def make_completion_workload(pairs, size, rng):
+    """Ground-truth `re` programs; responses are the same programs with masked API names, padded with comments to `size`."""
+    masked = {real: mask for real, mask in _load_library_names("re").items()}
+    responses, labels = [], []
+    for _ in range(pairs):
+        program = _COMPLETION_PROGRAM.format(a=rng.randint(0, 999), b=rng.randint(0, 999), c=rng.choice(WORDS))
+        response = program
+        for name in ("re.sub", "re.findall", "re.split", "re.escape"):
+            response = response.replace(name, masked[name])
+        response = response.replace("import re", f"import {masked['re']}")
+        # Comment lines go at the end so output lines stay aligned
+        padding = "".join(f"# {line}\n" for line in _filler(rng, max(0, size - len(response))).split(" ") if line)
+        responses.append(f"```python\n{response}{padding}```")
+        labels.append([program])
+    return responses, labels, [{} for _ in range(pairs)]
+
+
+WORKLOADS = {
+    "table_sql": (SQLMetric, make_sql_workload),
+    "wiki_qa": (WikiQAMetric, make_wiki_workload),
+    "history_reorder": (HistoryReorderMetric, make_history_workload),
+    "code_completion": (CompletionMetric, make_completion_workload),
+}
+
+
+def time_scoring(metric, responses, labels, extra_kwargs, batch_size):
+    """Seconds to score all pairs one by one (batch_size None) or in batches of `batch_size`."""
+    start = time.perf_counter()
+    if batch_size is None:
+        for response, label, kwargs in zip(responses, labels, extra_kwargs):
+            metric._evaluate_pair(response, label, **kwargs)
+    else:
+        for i in range(0, len(responses), batch_size):
+            metric._evaluate_batch(responses[i:i + batch_size], labels[i:i + batch_size], extra_kwargs[i:i + batch_size])
+    return time.perf_counter() - start
+
+
+def run_benchmarks(tasks, sizes, batch_sizes, pairs, completion_pairs, repeat, seed):
+    """
+    Time every (task, response size, per-pair or batch size) case.
+
+    Each repetition scores a freshly generated workload, so caches keyed by labels or queries start cold,
+    as they do on new instances. The best repetition is kept.
+
+    Returns:
+        Dict[str, float]: Microseconds per scored pair, keyed by "task/size=N/pair" or "task/size=N/batch=B".
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for task in tasks:
+            metric_cls, make_workload = WORKLOADS[task]
+            if task == "code_completion":
+                metric = metric_cls(expected_outputs=ExpectedOutputStore(f"{tmp_dir}/expected_outputs.sqlite"))
+                count = completion_pairs
+            else:
+                metric = metric_cls()
+                count = pairs
+            for size in sizes:
+                for batch_size in [None] + list(batch_sizes):
+                    name = f"{task}/size={size}/" + ("pair" if batch_size is None else f"batch={batch_size}")
+                    best = float("inf")
+                    for rep in range(repeat):
+                        responses, labels, extra_kwargs = make_workload(count, size, random.Random(f"{seed}/{task}/{size}/{batch_size}/{rep}"))
+                        if task == "code_completion":
+                            # Ground-truth programs run once ahead of scoring, as in script.eval
+                            metric.expected_outputs.precompute([label[0] for label in labels], metric.sandbox)
+                        best = min(best, time_scoring(metric, responses, labels, extra_kwargs, batch_size))
+                    results[name] = best / count * 1e6
+                    print(f"{name:<48} {results[name]:>12.1f} us/pair", flush=True)
+    return results
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark LongPiBench metrics on synthetic workloads.")
+    parser.add_argument("--tasks", nargs="+", choices=sorted(WORKLOADS), default=sorted(WORKLOADS), help="Metrics to benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 32000, 256000], help="Response sizes in characters.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64], help="Batch sizes for _evaluate_batch.")
+    parser.add_argument("--pairs", type=int, default=64, help="Pairs per case.")
+    parser.add_argument("--completion-pairs", type=int, default=8, help="Pairs per code completion case; each runs a subprocess.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per case; the fastest is kept.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the workload generators.")
+    add_baseline_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Main function to run the benchmarks."""
+    args = parse_args()
+    results = run_benchmarks(args.tasks, args.sizes, args.batch_sizes, args.pairs, args.completion_pairs, args.repeat, args.seed)
+    regressions = check_baseline(args, results, "us/pair")
+    if regressions:
+        sys.exit(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark CLI startup time, with saved baselines and a time budget for regression checks."""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+from script.baseline import add_baseline_args, check_baseline
+
+# Invocations that never reach the API or a metric; they should only pay for argument parsing
+COMMANDS = {
+    "eval_help": ["-m", "script.eval", "--help"],
+    "sweep_help": ["-m", "script.sweep", "--help"],
+    "store_help": ["-m", "src.result.store", "--help"],
+    "import_call": ["-c", "import src.llm.call"],
+    "import_eval": ["-c", "import script.eval"],
+}
+
+# Modules that are slow to import and must stay out of the invocations above
+HEAVY_MODULES = ["openai", "scipy", "numpy", "dotenv", "httpx"]
+
+
+def time_command(argv, repeat):
+    """Median wall-clock seconds of `repeat` runs of `python <argv>`, in a fresh interpreter each time."""
+    # No API key, as in a fresh checkout: nothing here should need one
+    env = {key: value for key, value in os.environ.items() if key != "YOUR_OPENAI_API_KEY"}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *argv], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def heavy_imports(module):
+    """Return the heavy modules that importing `module` loads."""
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return output.split()
+
+
+def run_benchmarks(commands, repeat):
+    """
+    Time every command and the bare interpreter.
+
+    Returns:
+        Dict[str, float]: Milliseconds per invocation, keyed by command name, plus "python" for `python -c pass`.
+    """
+    results = {"python": time_command(["-c", "pass"], repeat) * 1e3}
+    print(f"{'python':<16} {results['python']:>10.1f} ms", flush=True)
+    for name in commands:
+        results[name] = time_command(COMMANDS[name], repeat) * 1e3
+        print(f"{name:<16} {results[name]:>10.1f} ms  (+{results[name] - results['python']:.1f} ms over python)", flush=True)
+    return results
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark LongPiBench CLI startup time.")
+    parser.add_argument("--commands", nargs="+", choices=sorted(COMMANDS), default=sorted(COMMANDS), help="Invocations to time.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per invocation; the median is kept.")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Exit 1 if an invocation takes longer than this over bare python.")
+    add_baseline_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Main function to run the benchmarks."""
+    args = parse_args()
+    failures = []
+
+    for module in ("src.llm.call", "script.eval"):
+        loaded = heavy_imports(module)
+        if loaded:
+            print(f"import {module} loads {', '.join(loaded)}")
+            failures.append(f"import {module}")
+
+    results = run_benchmarks(args.commands, args.repeat)
+    if args.budget_ms is not None:
+        failures += [name for name in args.commands if results[name] - results["python"] > args.budget_ms]
+    failures += check_baseline(args, results, "ms", names=args.commands, width=16)
+
+    if failures:
+        sys.exit(f"Slow startup: {', '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,130 +1,355 @@
 """Script for LLM task evaluation with concise structure."""
 
-import sys
-import json
-from src.llm.call import llm_generate
-from src.metric.code_completion import CompletionMetric
-from src.metric.table_sql import SQLMetric
-from src.metric.history_reorder import HistoryReorderMetric
-from src.metric.wiki_retrieval import WikiQAMetric
-
-def parse_args():
-    """Parse command-line arguments."""
-    task_name = sys.argv[1]
-    seed_num = int(sys.argv[2])
-    random_sd_num = int(sys.argv[3])
-    model_name = sys.argv[4]
-    return task_name, seed_num, random_sd_num, model_name
+import os
+import queue
+import argparse
+import threading
+import importlib
+from itertools import zip_longest
+from src.llm.call import llm_generate_iter, get_endpoint
+from src.llm.batch import BatchRunner, make_batch_backend
+from src.llm.rate_limit import configure_rate_limit
+from src.llm.telemetry import Telemetry
+from src.dataset.prompt import LazyPromptList, PROMPT_STYLES
+from src.result.sink import ResultSink, RunManifest, result_key, load_results
+
+# Metric classes by task, as "module:class"; a module is only imported when its task runs
+METRICS = {
+    'code_completion': 'src.metric.code_completion:CompletionMetric',
+    'table_sql': 'src.metric.table_sql:SQLMetric',
+    'history_reorder': 'src.metric.history_reorder:HistoryReorderMetric',
+    'wiki_qa': 'src.metric.wiki_retrieval:WikiQAMetric',
+}
+
+def parse_args(argv=None):
+    """Parse command-line arguments (from `argv` if given, else sys.argv)."""
+    parser = argparse.ArgumentParser(description="Evaluate an LLM on a LongPiBench task.")
+    parser.add_argument("task_name", help="Task to evaluate, e.g. table_sql.")
+    parser.add_argument("seed_num", type=int, help="Number of data seeds to evaluate.")
+    parser.add_argument("random_sd_num", type=int, help="Number of random seeds for inference.")
+    parser.add_argument("model_name", help="Model name passed to the API.")
+    parser.add_argument("--max-workers", type=int, default=1, help="Maximum number of LLM requests in flight.")
+    parser.add_argument("--schedule", choices=["longest_first", "fifo"], default="longest_first", help="Dispatch order of concurrent requests: largest prompts first, or dataset order.")
+    parser.add_argument("--bucket-caps", type=int, nargs="+", default=None, help="Maximum requests in flight per prompt size bucket (<64K, 64K-128K, >=128K tokens).")
+    parser.add_argument("--rpm", type=int, default=None, help="Provider quota in requests per minute.")
+    parser.add_argument("--tpm", type=int, default=None, help="Provider quota in prompt tokens per minute.")
+    parser.add_argument("--metric-backend", choices=["serial", "thread", "process"], default=None, help="Scoring backend; defaults to the metric's own choice.")
+    parser.add_argument("--metric-workers", type=int, default=None, help="Number of scoring workers for the parallel backends.")
+    parser.add_argument("--score-batch", type=int, default=1, help="Number of finished generations scored together; above 1, results are written only once a batch is full.")
+    parser.add_argument("--pipeline", action="store_true", help="Score finished generations while inference continues, interleaving random seeds and splits.")
+    parser.add_argument("--score-workers", type=int, default=None, help="Number of scoring threads in pipeline mode; defaults to the metric's worker count or 1.")
+    parser.add_argument("--queue-size", type=int, default=256, help="Maximum number of generations waiting to be scored in pipeline mode.")
+    parser.add_argument("--batch", choices=["openai", "local"], default=None, help="Generate through a batch backend first: the provider's Batch API, or the local file-based stand-in.")
+    parser.add_argument("--batch-poll", type=float, default=30.0, help="Seconds between batch status checks.")
+    parser.add_argument("--batch-timeout", type=float, default=None, help="Stop waiting for batches after this many seconds; the rest is sent synchronously.")
+    parser.add_argument("--stream", action="store_true", help="Stream responses, capping output tokens and stopping at the end of the answer as the task allows.")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Output-token cap overriding the task's cap.")
+    parser.add_argument("--deadline", type=float, default=None, help="Cancel a request after this many seconds; streamed requests keep the text received so far.")
+    parser.add_argument("--prompt-style", choices=sorted(PROMPT_STYLES), default="default", help="Prompt template to use.")
+    parser.add_argument("--token-levels", "--token-level", dest="token_levels", type=int, nargs="+", default=[32000], help="Token levels of the instances to evaluate, all in one run.")
+    args = parser.parse_args(argv)
+    if args.batch and (args.stream or args.max_tokens is not None):
+        parser.error("--batch cannot be combined with --stream or --max-tokens")
+    return args
 
 def generate_random_seeds(base, count):
     """Generate a list of random seeds starting from a base value."""
     return [base + i for i in range(count)]
 
-def load_json(file_path):
-    """Load a JSON file and return its content."""
-    with open(file_path) as f:
-        return json.load(f)
+def select_positions(dataset, target_level, target_seed, token_levels):
+    """Select the records matching level, seed, and any of the token levels, using the file's sidecar index."""
+    return dataset.select(levels=target_level, seed_ids=target_seed, token_levels=token_levels)
 
-def filter_data(data, target_level, target_seed, token_level):
-    """Filter data based on level, seed, and token level."""
-    return [
-        datum for datum in data
-        if datum['level'] in target_level and datum['seed_id'] in target_seed and datum['token_level'] == token_level
-    ]
+def partition_by_token_level(records, token_levels):
+    """Group record indices by token level, in the order of `token_levels`; levels without records are left out."""
+    groups = {token_level: [] for token_level in token_levels}
+    for i, record in enumerate(records):
+        groups[record['token_level']].append(i)
+    return {token_level: indices for token_level, indices in groups.items() if indices}
 
-def prepare_input_list(data):
-    """Prepare input list for LLM inference."""
-    inputs = []
-    for datum in data:
-        inputs.append({
-            'system_prompt': datum['default_prompt']['system_prompt'],
-            'user_message': datum['default_prompt']['user_message'].format(
-                context=datum['context'], query=datum['question']
-            )
-        })
-    return inputs
+def prepare_input_list(dataset, positions, prompt_style='default'):
+    """Prepare lazily formatted inputs for LLM inference; `.records` holds the instance metadata."""
+    return LazyPromptList(dataset, positions, prompt_style)
 
 def get_metric(task_name):
-    """Return the appropriate metric class based on task name."""
-    metrics = {
-        'code_completion': CompletionMetric,
-        'table_sql': SQLMetric,
-        'history_reorder': HistoryReorderMetric,
-        'wiki_qa': WikiQAMetric
+    """Return the appropriate metric based on task name, importing its module on first use."""
+    if task_name not in METRICS:
+        return None
+    module_name, class_name = METRICS[task_name].split(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def generation_kwargs(metric, args):
+    """
+    Output limits of the generation requests: with --stream, the metric's output-token cap and stop condition;
+    --max-tokens overrides the cap and --deadline sets the deadline in any mode.
+    """
+    return {
+        'stream': args.stream,
+        'max_tokens': args.max_tokens if args.max_tokens is not None else (metric.max_tokens if args.stream else None),
+        'stop_condition': metric.stop_condition if args.stream else None,
+        'deadline': args.deadline,
     }
-    return metrics.get(task_name, lambda: None)()
 
-def evaluate(data, outputs, metric, task_name):
+def evaluate(data, outputs, metric, random_sd, backend=None, max_workers=None):
     """Evaluate outputs and print results."""
+    scores = metric.evaluate(
+        outputs,
+        [input_instance['answers'] for input_instance in data],
+        extra_kwargs=[metric.kwargs_for(input_instance) for input_instance in data],
+        backend=backend,
+        max_workers=max_workers,
+    )
     res_list = []
-    for input_instance, output_instance in zip(data, outputs):
-        res = (
-            metric._evaluate_pair(output_instance, input_instance['answers'])
-            if task_name != 'history_reorder'
-            else metric._evaluate_pair(output_instance, input_instance['answers'], input_instance['question'])
-        )
+    for input_instance, output_instance, res in zip(data, outputs, scores):
         res_instance = {}
         res_instance['seed_id'] = input_instance['seed_id']
         res_instance['level'] = input_instance['level']
         res_instance['type'] = input_instance['type']
         res_instance['token_level'] = input_instance['token_level']
+        res_instance['random_seed'] = random_sd
         res_instance['llm_output'] = output_instance
         res_instance['metric_result'] = res
         res_list.append(res_instance)
     return res_list
 
-def main():
-    
-    """Main function to execute the script."""
-    task_name, seed_num, random_sd_num, model_name = parse_args()
+def run_splits(jobs, metric, args, telemetry=None):
+    """
+    Generate, score and write the instances of several splits that their sinks do not hold yet.
+
+    `jobs` is a list of (inputs, data, sink, random_sd). Pending instances of all jobs, i.e. every token
+    level, random seed and split, go through one generation stream, job after job. Each finished
+    generation is scored and written as soon as it arrives (in batches of `--score-batch` if set above 1),
+    so an interrupted run loses nothing it has generated and resumes where it stopped.
+    """
+    work = [
+        (job_idx, i)
+        for job_idx, (inputs, data, sink, random_sd) in enumerate(jobs)
+        for i, datum in enumerate(data)
+        if result_key(dict(datum, random_seed=random_sd)) not in sink
+    ]
+    if not work:
+        return
+    batch = []
+
+    def flush():
+        for job_idx in dict.fromkeys(job_idx for job_idx, _, _ in batch):
+            inputs, data, sink, random_sd = jobs[job_idx]
+            items = [(i, output) for j, i, output in batch if j == job_idx]
+            results = evaluate([data[i] for i, _ in items], [output for _, output in items], metric, random_sd, args.metric_backend, args.metric_workers)
+            for res_instance in results:
+                sink.write(res_instance)
+        batch.clear()
+
+    for k, output in llm_generate_iter(
+        [jobs[job_idx][0][i] for job_idx, i in work],
+        model=args.model_name,
+        max_workers=args.max_workers,
+        seeds=[jobs[job_idx][3] for job_idx, _ in work],
+        schedule=args.schedule,
+        bucket_caps=args.bucket_caps,
+        telemetry=telemetry,
+        **generation_kwargs(metric, args),
+    ):
+        job_idx, i = work[k]
+        batch.append((job_idx, i, output))
+        if len(batch) >= args.score_batch:
+            flush()
+    if batch:
+        flush()
+
+def run_pipelined(jobs, metric, args, telemetry=None):
+    """
+    Generate and score several splits at once, overlapping inference with scoring.
+
+    `jobs` is a list of (inputs, data, sink, random_sd). Pending instances of all jobs are interleaved
+    into one generation stream; finished generations go through a bounded queue to scoring threads,
+    which score them in small batches and write them to their job's sink.
+    """
+    pending = [
+        [(job_idx, i) for i, datum in enumerate(data) if result_key(dict(datum, random_seed=random_sd)) not in sink]
+        for job_idx, (inputs, data, sink, random_sd) in enumerate(jobs)
+    ]
+    # Round-robin over jobs so every random seed and split makes progress from the start
+    work = [item for group in zip_longest(*pending) for item in group if item is not None]
+    if not work:
+        return
+
+    finished = queue.Queue(maxsize=args.queue_size)
+    errors = []
+
+    def score_worker():
+        while True:
+            item = finished.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < args.score_batch:
+                try:
+                    item = finished.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished.put(None)  # leave the stop signal for this worker's next loop
+                    break
+                batch.append(item)
+            try:
+                for job_idx in {job_idx for job_idx, _, _ in batch}:
+                    inputs, data, sink, random_sd = jobs[job_idx]
+                    items = [(i, output) for j, i, output in batch if j == job_idx]
+                    results = evaluate([data[i] for i, _ in items], [output for _, output in items], metric, random_sd, 'serial')
+                    for res_instance in results:
+                        sink.write(res_instance)
+            except Exception as e:
+                errors.append(e)
+
+    score_workers = args.score_workers or metric.max_workers or 1
+    workers = [threading.Thread(target=score_worker, daemon=True) for _ in range(score_workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for k, output in llm_generate_iter(
+            [jobs[job_idx][0][i] for job_idx, i in work],
+            model=args.model_name,
+            max_workers=args.max_workers,
+            seeds=[jobs[job_idx][3] for job_idx, _ in work],
+            schedule=args.schedule,
+            bucket_caps=args.bucket_caps,
+            telemetry=telemetry,
+            **generation_kwargs(metric, args),
+        ):
+            if errors:
+                break
+            job_idx, i = work[k]
+            finished.put((job_idx, i, output))
+    finally:
+        for _ in workers:
+            finished.put(None)
+        for worker in workers:
+            worker.join()
+    if errors:
+        raise errors[0]
+
+def run_batches(todo, save_dir, args):
+    """
+    Send the pending instances of all splits through the batch backend selected by `--batch`.
+
+    Responses land in the response cache, so the normal generation flow afterwards is served from it;
+    requests the batch could not answer are sent synchronously there.
+    """
+    inputs, seeds = [], []
+    for name, split_inputs, data, random_sd in todo:
+        done = {result_key(result) for result in load_results(f'{save_dir}/{name}.jsonl')}
+        for i, datum in enumerate(data):
+            if result_key(dict(datum, random_seed=random_sd)) not in done:
+                inputs.append(split_inputs[i])
+                seeds.append(random_sd)
+    if not inputs:
+        return
+    endpoint = get_endpoint(args.model_name)
+    backend = make_batch_backend(args.batch, endpoint.get_client(), os.path.join('.cache', 'local_batches'))
+    runner = BatchRunner(backend, os.path.join(save_dir, 'batches'), poll_interval=args.batch_poll, timeout=args.batch_timeout)
+    stats = runner.run(inputs, model=args.model_name, seeds=seeds, endpoint_model=endpoint.model_name(args.model_name))
+    print(f"Batch inference: {stats['submitted']} submitted, {stats['stored']} stored, {stats['failed']} failed, {stats['unfinished']} batches unfinished.")
+
+def open_dataset(path, datasets):
+    """
+    Return the dataset for `path` from the shared `datasets` dict, opening it on first use.
+
+    A compact store converted from `path` (see `src.dataset.compact`) is read instead of the JSON file when it exists.
+    """
+    # Imported here: the compact reader needs numpy, which --help and dry runs do not
+    from src.dataset.compact import open_task_file
+
+    if path not in datasets:
+        datasets[path] = open_task_file(path)
+    return datasets[path]
+
+def run(args, datasets=None, metric=None):
+    """
+    Run one evaluation described by `args` (see parse_args).
+
+    `datasets` maps task file paths to open datasets (IndexedDataset or CompactDataset) and `metric` is the task's metric;
+    both may be shared between runs in the same process. Datasets opened here are closed at the end.
+    """
+    task_name, seed_num, random_sd_num, model_name = args.task_name, args.seed_num, args.random_sd_num, args.model_name
     random_sd_list = generate_random_seeds(42, random_sd_num)
+    token_levels = sorted(set(args.token_levels))
     
-    # save dir
+    # save dir; results of each token level go to its own tl<N>/ subdirectory
     save_dir = f'res/{task_name}_{model_name}_dsd{seed_num}_rsd{random_sd_num}'
+    if args.prompt_style != 'default':
+        save_dir += f'_{args.prompt_style}'
     # make dir if not exist
-    import os
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
+    os.makedirs(save_dir, exist_ok=True)
     
     # File paths
+    owns_datasets = datasets is None
+    datasets = {} if owns_datasets else datasets
     json_path_absolute = f"data/{task_name}_absolute.json"
     json_path_relative = f"data/{task_name}_relative.json"
+    dataset_absolute = open_dataset(json_path_absolute, datasets)
+    dataset_relative = open_dataset(json_path_relative, datasets)
 
-    # Load data
-    data_absolute = load_json(json_path_absolute)
-    data_relative = load_json(json_path_relative)
-
-    # Filter data
+    # Select data
     # target_level = [f'level {i}' for i in ('1', '4', '8', '12', '16')]  # debug, for full set, from 1 to 16
     target_level = [f'level {i}' for i in range(1, 17)]
     target_seed = [f'{task_name}_{seed}' for seed in range(1, seed_num + 1)]
-    token_level = 32000
-    target_data_absolute = filter_data(data_absolute, target_level, target_seed, token_level)
-    target_data_relative = filter_data(data_relative, target_level, target_seed, token_level)
+    positions_absolute = select_positions(dataset_absolute, target_level, target_seed, token_levels)
+    positions_relative = select_positions(dataset_relative, target_level, target_seed, token_levels)
 
-    # Prepare inputs
-    input_lists_absolute = prepare_input_list(target_data_absolute)
-    input_lists_relative = prepare_input_list(target_data_relative)
+    # Prepare inputs of all token levels in one pass over each file; prompts are formatted only when a request needs them
+    input_lists_absolute = prepare_input_list(dataset_absolute, positions_absolute, args.prompt_style)
+    input_lists_relative = prepare_input_list(dataset_relative, positions_relative, args.prompt_style)
+    target_data_absolute = input_lists_absolute.records
+    target_data_relative = input_lists_relative.records
 
     # Get metric
-    metric = get_metric(task_name)
-
-    # LLM inference and evaluation
-    for random_sd in random_sd_list:
-        
-        specific_save_dir_absolute = f'{save_dir}/rsd_{random_sd}_absolute'
-        specific_save_dir_relative = f'{save_dir}/rsd_{random_sd}_relative'
-        
-        output_lists_absolute = llm_generate(input_lists_absolute, model=model_name, seed=random_sd)
-        output_lists_relative = llm_generate(input_lists_relative, model=model_name,seed=random_sd)
-
-        res_absolute = evaluate(target_data_absolute, output_lists_absolute, metric, task_name)
-        res_relative = evaluate(target_data_relative, output_lists_relative, metric, task_name)
-        
-        with open(f'{specific_save_dir_absolute}.json', 'w') as f:
-            json.dump(res_absolute, f, indent=4)
-        with open(f'{specific_save_dir_relative}.json', 'w') as f:
-            json.dump(res_relative, f, indent=4)
+    metric = metric or get_metric(task_name)
+    if task_name == 'code_completion':
+        # Run each ground-truth program once up front; scoring then only runs the model's code
+        ground_truths = [datum['answers'][0] for datum in target_data_absolute + target_data_relative]
+        metric.expected_outputs.precompute(ground_truths, metric.sandbox)
+
+    # LLM inference and evaluation; results are appended per instance and finished splits are recorded in the manifest
+    # Per-request telemetry goes next to the results: telemetry.jsonl, with aggregates in telemetry.json / telemetry.prom
+    manifest = RunManifest(save_dir)
+    telemetry = Telemetry.for_run_dir(save_dir)
+    splits = []
+    for split_type, input_list in (('absolute', input_lists_absolute), ('relative', input_lists_relative)):
+        for token_level, indices in partition_by_token_level(input_list.records, token_levels).items():
+            splits.append((f'tl{token_level}', split_type, [input_list[i] for i in indices], [input_list.records[i] for i in indices]))
+    todo = [
+        (f'{level_dir}/rsd_{random_sd}_{split_type}', inputs, data, random_sd)
+        for random_sd in random_sd_list
+        for level_dir, split_type, inputs, data in splits
+        if not manifest.is_complete(f'{level_dir}/rsd_{random_sd}_{split_type}', expected=len(data))
+    ]
+    if args.batch:
+        run_batches(todo, save_dir, args)
+    # All pending splits share one generation stream; --pipeline also scores them while inference continues
+    sinks = [ResultSink(f'{save_dir}/{name}.jsonl') for name, _, _, _ in todo]
+    jobs = [(inputs, data, sink, random_sd) for (_, inputs, data, random_sd), sink in zip(todo, sinks)]
+    try:
+        if args.pipeline:
+            run_pipelined(jobs, metric, args, telemetry)
+        else:
+            run_splits(jobs, metric, args, telemetry)
+    finally:
+        for sink in sinks:
+            sink.close()
+        telemetry.close()
+    for (name, _, data, _), sink in zip(todo, sinks):
+        manifest.mark_complete(name, expected=len(data), written=len(sink.done))
+
+    if owns_datasets:
+        for dataset in datasets.values():
+            dataset.close()
+
+def main():
+    """Main function to execute the script."""
+    args = parse_args()
+    configure_rate_limit(args.model_name, rpm=args.rpm, tpm=args.tpm, max_concurrency=args.max_workers)
+    run(args)
 
 if __name__ == "__main__":
     main()
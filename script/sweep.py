@@ -0,0 +1,89 @@
+"""Run a whole evaluation sweep (tasks x models x token levels) in one process."""
+
+import sys
+import json
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from src.llm.rate_limit import configure_rate_limit, set_global_concurrency
+from script.eval import parse_args as parse_eval_args, run, get_metric, open_dataset
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Run a LongPiBench evaluation sweep described by a JSON spec.")
+    parser.add_argument("spec", help="Path to the sweep spec, see script/sweep_example.json.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the streams of the sweep and exit.")
+    return parser.parse_args()
+
+def load_spec(path):
+    """
+    Load a sweep spec and normalize its model entries to {name: settings}.
+
+    A model may be given as a plain name or as an object with "name" and optional
+    "max_concurrency", "rpm" and "tpm".
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    models = {}
+    for model in spec["models"]:
+        if isinstance(model, str):
+            model = {"name": model}
+        models[model["name"]] = model
+    spec["models"] = models
+    spec.setdefault("token_levels", [32000])
+    spec.setdefault("eval_args", [])
+    return spec
+
+def build_streams(spec):
+    """Return the eval arguments of every (task, model) stream of the sweep; each stream covers all token levels."""
+    streams = []
+    for task_name in spec["tasks"]:
+        for model_name, model in spec["models"].items():
+            argv = [
+                task_name, str(spec["data_seed_num"]), str(spec["random_seed_num"]), model_name,
+                "--max-workers", str(model.get("max_concurrency", 8)),
+                "--token-levels", *[str(token_level) for token_level in spec["token_levels"]],
+            ] + list(spec["eval_args"])
+            streams.append(parse_eval_args(argv))
+    return streams
+
+def main():
+    """Main function to execute the sweep."""
+    args = parse_args()
+    spec = load_spec(args.spec)
+    streams = build_streams(spec)
+    if args.dry_run:
+        for stream in streams:
+            print(f"{stream.task_name} {stream.model_name} token_levels={stream.token_levels} max_workers={stream.max_workers}")
+        return
+
+    # Global and per-model budgets: a throttled provider only slows down its own streams
+    set_global_concurrency(spec.get("max_concurrency"))
+    for model_name, model in spec["models"].items():
+        configure_rate_limit(model_name, rpm=model.get("rpm"), tpm=model.get("tpm"), max_concurrency=model.get("max_concurrency", 8))
+
+    # Datasets and metrics are loaded once and shared by all streams of a task
+    datasets = {}
+    metrics = {}
+    for task_name in spec["tasks"]:
+        for split_type in ("absolute", "relative"):
+            open_dataset(f"data/{task_name}_{split_type}.json", datasets)
+        metrics[task_name] = get_metric(task_name)
+
+    def run_stream(stream):
+        try:
+            run(stream, datasets=datasets, metric=metrics[stream.task_name])
+        except Exception:
+            traceback.print_exc()
+            return f"{stream.task_name} {stream.model_name}"
+
+    with ThreadPoolExecutor(max_workers=len(streams)) as executor:
+        failed = [name for name in executor.map(run_stream, streams) if name is not None]
+
+    for dataset in datasets.values():
+        dataset.close()
+    if failed:
+        sys.exit("Failed streams:\n" + "\n".join(failed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import json
+import mmap
+import zlib
+import argparse
+from functools import lru_cache
+
+import numpy as np
+
+from .loader import INDEX_FIELDS, IndexedDataset
+
+
+FORMAT_VERSION = 1
+
+# One chunk per line, newline included, so joining the chunks restores the context exactly
+_CHUNK_PATTERN = re.compile(r"[^\n]*\n|[^\n]+")
+
+
+def split_chunks(context):
+    """Split a context into the chunks that are deduplicated: its lines, each with its trailing newline."""
+    return _CHUNK_PATTERN.findall(context)
+
+
+def compact_path(path):
+    """Directory of the compact store converted from the task file `path` (`data/x.json` -> `data/x.compact`)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.compact" if ext == ".json" else f"{path}.compact"
+
+
+def source_signature(path):
+    """Size and modification time of a task file, recorded in its store to detect later changes."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def convert(source, target, block_size=1 << 18, level=6):
+    """
+    Convert a LongPiBench task file into a compact store in the directory `target`.
+
+    Every context is split into lines (see `split_chunks`), and each distinct line is stored once.
+    Chunks are packed, in order of first appearance, into blocks of about `block_size` bytes, and each
+    block is compressed with zlib. A record then keeps a span into a shared array of chunk ids instead
+    of its context. The store holds:
+        blocks.bin: the compressed blocks, back to back;
+        blocks.npy: the byte offset of every block in blocks.bin, plus the end offset;
+        chunks.npy: the (block, offset in block, length) of every chunk, in uncompressed bytes;
+        chunk_ids.npy: the chunk ids of all contexts, record after record;
+        records.jsonl: every record without its context, in file order, with `context_chunks`
+            (start and end of its span in chunk_ids) and `context_bytes` (UTF-8 length of the context);
+        meta.json: format version, source file with its size and modification time, and counts.
+
+    Args:
+        source (str): Task file, a JSON array or JSON Lines of records.
+        target (str): Output directory, created if needed; existing store files are replaced.
+        block_size (int): Uncompressed bytes per block. Smaller blocks make random reads cheaper.
+        level (int): zlib compression level.
+
+    Returns:
+        Dict[str, int]: Record, chunk and byte counts of the conversion.
+    """
+    os.makedirs(target, exist_ok=True)
+    # Drop the old meta.json first, so an interrupted conversion never leaves a store that looks complete
+    try:
+        os.remove(os.path.join(target, "meta.json"))
+    except FileNotFoundError:
+        pass
+    # Taken before reading, so a source modified during the conversion no longer matches the store
+    signature = source_signature(source)
+    chunk_index = {}
+    chunk_table = []
+    chunk_ids = []
+    block_offsets = [0]
+    pending = []
+    pending_size = 0
+    context_bytes_total = 0
+
+    with open(os.path.join(target, "blocks.bin.tmp"), "wb") as blocks, \
+            open(os.path.join(target, "records.jsonl.tmp"), "w", encoding="utf-8") as records:
+
+        def flush():
+            nonlocal pending, pending_size
+            if pending:
+                blocks.write(zlib.compress(b"".join(pending), level))
+                block_offsets.append(blocks.tell())
+                pending, pending_size = [], 0
+
+        with IndexedDataset(source) as dataset:
+            for record in dataset.iter_records():
+                context = record.pop("context", None)
+                if context is not None:
+                    start = len(chunk_ids)
+                    for chunk in split_chunks(context):
+                        chunk_id = chunk_index.get(chunk)
+                        if chunk_id is None:
+                            data = chunk.encode("utf-8")
+                            if pending_size and pending_size + len(data) > block_size:
+                                flush()
+                            chunk_id = chunk_index[chunk] = len(chunk_table)
+                            chunk_table.append((len(block_offsets) - 1, pending_size, len(data)))
+                            pending.append(data)
+                            pending_size += len(data)
+                        chunk_ids.append(chunk_id)
+                    record["context_chunks"] = [start, len(chunk_ids)]
+                    record["context_bytes"] = len(context.encode("utf-8"))
+                    context_bytes_total += record["context_bytes"]
+                records.write(json.dumps(record, ensure_ascii=False) + "\n")
+            record_count = len(dataset)
+        flush()
+
+    np.save(os.path.join(target, "blocks.npy"), np.asarray(block_offsets, dtype=np.int64))
+    np.save(os.path.join(target, "chunks.npy"), np.asarray(chunk_table, dtype=np.int64).reshape(-1, 3))
+    np.save(os.path.join(target, "chunk_ids.npy"), np.asarray(chunk_ids, dtype=np.uint32))
+    os.replace(os.path.join(target, "blocks.bin.tmp"), os.path.join(target, "blocks.bin"))
+    os.replace(os.path.join(target, "records.jsonl.tmp"), os.path.join(target, "records.jsonl"))
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "source": os.path.basename(source),
+        "source_signature": signature,
+        "records": record_count,
+        "chunks": len(chunk_table),
+        "chunk_refs": len(chunk_ids),
+        "blocks": len(block_offsets) - 1,
+        "context_bytes": context_bytes_total,
+        "unique_bytes": sum(length for _, _, length in chunk_table),
+        "compressed_bytes": block_offsets[-1],
+    }
+    # meta.json is written last: a store without it is incomplete
+    with open(os.path.join(target, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+class CompactDataset:
+    """
+    Random-access reader for a compact store written by `convert`, with the interface of `IndexedDataset`.
+
+    Records without their contexts are loaded up front. Chunk tables and the compressed blocks are
+    memory-mapped, and a context is rebuilt from its chunks when its record is read. The most recently
+    used decompressed blocks are kept, up to `cached_blocks` of them.
+    """
+
+    def __init__(self, path, cached_blocks=64):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact store version {self.meta['version']} in {path}")
+        with open(os.path.join(path, "records.jsonl"), encoding="utf-8") as f:
+            self.records = [json.loads(line) for line in f]
+        self.entries = [[None, None] + [record.get(field) for field in INDEX_FIELDS] for record in self.records]
+        self.block_offsets = np.load(os.path.join(path, "blocks.npy"), mmap_mode="r")
+        self.chunks = np.load(os.path.join(path, "chunks.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(path, "chunk_ids.npy"), mmap_mode="r")
+        self.file = open(os.path.join(path, "blocks.bin"), "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.meta["compressed_bytes"] else b""
+        # lru_cache is thread-safe, so concurrent requests can read contexts
+        self._block = lru_cache(maxsize=cached_blocks)(self._decompress)
+
+    def _decompress(self, block):
+        return zlib.decompress(self.buffer[int(self.block_offsets[block]):int(self.block_offsets[block + 1])])
+
+    def context(self, position):
+        """Rebuild the context of the record at `position`, identical to the original one."""
+        start, end = self.records[position]["context_chunks"]
+        parts = []
+        for block, offset, length in self.chunks[self.chunk_ids[start:end]].tolist():
+            parts.append(self._block(block)[offset:offset + length])
+        return b"".join(parts).decode("utf-8")
+
+    def __len__(self):
+        return len(self.records)
+
+    select = IndexedDataset.select
+    metadata = IndexedDataset.metadata
+
+    def read(self, position):
+        """Return the record at `position` with its context rebuilt."""
+        record = dict(self.records[position])
+        span = record.pop("context_chunks", None)
+        record.pop("context_bytes", None)
+        if span is not None:
+            record["context"] = self.context(position)
+        return record
+
+    iter_records = IndexedDataset.iter_records
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_task_file(path):
+    """
+    Open a task file, reading its compact store (see `compact_path`) instead when one exists.
+
+    A store whose recorded source size or modification time no longer matches the task file is stale;
+    the task file is then read directly, with a warning. A store without its task file is read as is.
+    """
+    meta_path = os.path.join(compact_path(path), "meta.json")
+    if not os.path.exists(meta_path):
+        return IndexedDataset(path)
+    if os.path.exists(path):
+        with open(meta_path) as f:
+            recorded = json.load(f).get("source_signature")
+        if recorded != source_signature(path):
+            print(f"Warning: {compact_path(path)} is out of date with {path}; reading {path} instead. Convert it again to use the store.")
+            return IndexedDataset(path)
+    return CompactDataset(compact_path(path))
+
+
+def verify(source, target):
+    """Return the positions of records whose rebuilt version differs from the original; empty if the store is exact."""
+    mismatches = []
+    with IndexedDataset(source) as original, CompactDataset(target) as compact:
+        if len(original) != len(compact):
+            raise ValueError(f"{target} holds {len(compact)} records, {source} holds {len(original)}")
+        for position in range(len(original)):
+            if original.read(position) != compact.read(position):
+                mismatches.append(position)
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert LongPiBench task files to compact deduplicated stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert task files, each into <name>.compact/ next to it.")
+    convert_parser.add_argument("paths", nargs="+", help="Task files, e.g. data/table_sql_absolute.json.")
+    convert_parser.add_argument("--block-size", type=int, default=1 << 18, help="Uncompressed bytes per compressed block.")
+    convert_parser.add_argument("--no-verify", action="store_true", help="Skip checking every record against the original.")
+    stats_parser = subparsers.add_parser("stats", help="Print the counts of compact stores.")
+    stats_parser.add_argument("paths", nargs="+", help="Compact store directories.")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for path in args.paths:
+            meta = convert(path, compact_path(path), block_size=args.block_size)
+            print(
+                f"{path}: {meta['records']} records, {meta['chunk_refs']} chunks of which {meta['chunks']} unique, "
+                f"{meta['context_bytes']} context bytes -> {meta['compressed_bytes']} compressed"
+            )
+            if not args.no_verify:
+                mismatches = verify(path, compact_path(path))
+                if mismatches:
+                    sys.exit(f"{path}: {len(mismatches)} records differ after conversion, e.g. position {mismatches[0]}")
+    else:
+        for path in args.paths:
+            with open(os.path.join(path, "meta.json")) as f:
+                print(json.dumps({"path": path, **json.load(f)}, indent=4))
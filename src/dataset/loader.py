@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import mmap
+
+
+# A JSON string (with escapes) or a brace outside of strings
+_TOKEN_PATTERN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]')
+
+INDEX_FIELDS = ("level", "seed_id", "token_level", "type")
+INDEX_VERSION = 1
+
+
+def scan_records(buffer):
+    """
+    Find the byte span of every top-level JSON object in `buffer`.
+
+    Works for a JSON array of objects as well as for JSON Lines. Strings are skipped as whole tokens,
+    so braces inside contexts do not affect the nesting depth.
+
+    Args:
+        buffer (bytes-like): File content, typically an `mmap.mmap`.
+
+    Yields:
+        Tuple[int, int]: Start and end offsets of each object, end exclusive.
+    """
+    depth = 0
+    start = 0
+    for match in _TOKEN_PATTERN.finditer(buffer):
+        token = match.group()
+        if token == b"{":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif token == b"}":
+            depth -= 1
+            if depth == 0:
+                yield start, match.end()
+
+
+class IndexedDataset:
+    """
+    Random-access reader for a LongPiBench task file.
+
+    On first use, the file is scanned once and a sidecar index (`<path>.idx.json`) with the byte offsets
+    and the (level, seed_id, token_level, type) of every record is written next to it. Later runs load
+    only the index, select the records they need and parse just those from a memory-mapped view.
+    The index is rebuilt automatically when the data file changes.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or f"{path}.idx.json"
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = self._load_index()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_index(self):
+        signature = self._signature()
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get("signature") == signature:
+                return index["entries"]
+
+        entries = []
+        for start, end in scan_records(self.buffer):
+            record = json.loads(self.buffer[start:end])
+            entries.append([start, end] + [record.get(field) for field in INDEX_FIELDS])
+
+        # Write atomically so concurrent runs never read a partial index
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"signature": signature, "fields": INDEX_FIELDS, "entries": entries}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # Read-only data directory: keep the index in memory only
+            pass
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def select(self, levels=None, seed_ids=None, token_levels=None, types=None):
+        """
+        Return the positions of records matching all given filters, in file order.
+
+        Each filter is a collection of accepted values; None accepts everything.
+        """
+        filters = [
+            (2 + i, set(values))
+            for i, values in enumerate((levels, seed_ids, token_levels, types))
+            if values is not None
+        ]
+        return [
+            position for position, entry in enumerate(self.entries)
+            if all(entry[column] in accepted for column, accepted in filters)
+        ]
+
+    def metadata(self, position):
+        """Return the indexed fields of the record at `position` without parsing it."""
+        return dict(zip(INDEX_FIELDS, self.entries[position][2:]))
+
+    def read(self, position):
+        """Parse and return the record at `position`."""
+        start, end = self.entries[position][:2]
+        return json.loads(self.buffer[start:end])
+
+    def iter_records(self, positions=None):
+        """Yield records one at a time, so only one is held in memory by the reader."""
+        for position in range(len(self.entries)) if positions is None else positions:
+            yield self.read(position)
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,93 @@
+from collections.abc import Mapping, Sequence
+
+
+PROMPT_STYLES = {
+    "default": "default_prompt",
+    "query_head": "query_head_prompt",
+    "query_tail": "query_tail_prompt",
+}
+
+# Record fields that hold the long context or prompt templates and are never kept in memory
+_HEAVY_FIELDS = ("context", "default_prompt", "query_head_prompt", "query_tail_prompt")
+
+
+def prompt_template(record, prompt_style="default"):
+    """
+    Return the (system_prompt, user_message template) pair of a record for the given prompt style.
+
+    A template may be a dict with 'system_prompt' and 'user_message', or a plain user message
+    string, in which case the system prompt of `default_prompt` is used.
+
+    Args:
+        record (Dict[str, Any]): A full dataset record.
+        prompt_style (str): One of "default", "query_head" or "query_tail".
+
+    Returns:
+        Tuple[str, str]: System prompt and unformatted user message template.
+    """
+    template = record[PROMPT_STYLES[prompt_style]]
+    if isinstance(template, dict):
+        return template["system_prompt"], template["user_message"]
+    return record["default_prompt"]["system_prompt"], template
+
+
+def format_prompt(record, prompt_style="default"):
+    """
+    Build the (system_prompt, user_message) pair of a record, with context and query filled in.
+    """
+    system_prompt, user_message = prompt_template(record, prompt_style)
+    return system_prompt, user_message.format(context=record["context"], query=record["question"])
+
+
+class LazyPrompt(Mapping):
+    """
+    Inference input whose 'user_message' is formatted from the dataset only when it is accessed.
+
+    The formatted message is not kept, so the context lives in memory only while a request
+    (or cache lookup) is using it.
+    """
+
+    def __init__(self, dataset, position, prompt_style, system_prompt, token_length):
+        self.dataset = dataset
+        self.position = position
+        self.prompt_style = prompt_style
+        self.fields = {"system_prompt": system_prompt, "token_length": token_length}
+
+    def __getitem__(self, key):
+        if key == "user_message":
+            return format_prompt(self.dataset.read(self.position), self.prompt_style)[1]
+        return self.fields[key]
+
+    def __iter__(self):
+        yield "system_prompt"
+        yield "user_message"
+        yield "token_length"
+
+    def __len__(self):
+        return 3
+
+
+class LazyPromptList(Sequence):
+    """
+    Sequence of `LazyPrompt` inputs for the selected records of an `IndexedDataset`.
+
+    Each record is parsed once up front to keep its lightweight fields (question, answers, level, ...)
+    in `records`; contexts and prompt templates are dropped and re-read on demand.
+    """
+
+    def __init__(self, dataset, positions, prompt_style="default"):
+        if prompt_style not in PROMPT_STYLES:
+            raise ValueError(f"Unknown prompt style: {prompt_style}")
+        self.records = []
+        self.prompts = []
+        for position in positions:
+            record = dataset.read(position)
+            system_prompt, _ = prompt_template(record, prompt_style)
+            self.records.append({k: v for k, v in record.items() if k not in _HEAVY_FIELDS})
+            self.prompts.append(LazyPrompt(dataset, position, prompt_style, system_prompt, record.get("token_length")))
+
+    def __getitem__(self, index):
+        return self.prompts[index]
+
+    def __len__(self):
+        return len(self.prompts)
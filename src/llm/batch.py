@@ -0,0 +1,353 @@
+"""Batch-API inference: send many generation requests as one offline batch and load the results into the response cache."""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tqdm
+
+from src.llm.cache import get_response_cache, cache_key
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def chat_body(input_dict, model, temp, top_p, seed, max_tokens=None):
+    """Request body of one chat completion, as sent by `src.llm.call`; `max_tokens` is only included when set."""
+    body = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": input_dict["system_prompt"]},
+            {"role": "user", "content": input_dict["user_message"]},
+        ],
+        "temperature": temp,
+        "top_p": top_p,
+        "seed": seed,
+    }
+    if max_tokens is not None:
+        body["max_tokens"] = max_tokens
+    return body
+
+
+class OpenAIBatchBackend:
+    """
+    Batches through the OpenAI Batch API (or a compatible provider): upload, create, poll, download.
+
+    Args:
+        client (OpenAI): Client of the provider.
+        completion_window (str): Completion window requested for each batch.
+    """
+
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path):
+        """Upload a batch input JSONL file and start the batch. Returns the batch id."""
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Return {"status", "completed", "failed", "total"} of a batch."""
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+        }
+
+    def download(self, batch_id, path):
+        """Write the output and error lines of a finished batch to `path`."""
+        batch = self.client.batches.retrieve(batch_id)
+        with open(path, "wb") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).read())
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for a batch API, for running the batch path without a provider.
+
+    Each batch lives in `root/<batch_id>/` (input.jsonl, output.jsonl, status.json) and is executed by
+    a background thread that passes every request body to `respond`. A batch left unfinished by an
+    earlier process is picked up again, skipping requests that already have an output line.
+
+    Args:
+        root (str): Directory holding the batches.
+        respond (Callable[[Dict], Dict]): Returns the chat completion (as a dict) for a request body,
+            e.g. `forward_to(client)` to execute the batch against any chat completions endpoint.
+        max_workers (int): Requests executed concurrently within a batch.
+    """
+
+    def __init__(self, root, respond, max_workers=4):
+        self.root = root
+        self.respond = respond
+        self.max_workers = max_workers
+        self.threads = {}
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, batch_id):
+        return os.path.join(self.root, batch_id)
+
+    def _write_status(self, batch_id, status):
+        path = os.path.join(self._dir(batch_id), "status.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(status, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _read_status(self, batch_id):
+        with open(os.path.join(self._dir(batch_id), "status.json")) as f:
+            return json.load(f)
+
+    def _ensure_running(self, batch_id):
+        with self.lock:
+            thread = self.threads.get(batch_id)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._execute, args=(batch_id,), daemon=True)
+                self.threads[batch_id] = thread
+                thread.start()
+
+    def _execute(self, batch_id):
+        batch_dir = self._dir(batch_id)
+        output_path = os.path.join(batch_dir, "output.jsonl")
+        done = set()
+        if os.path.exists(output_path):
+            with open(output_path, encoding="utf-8") as f:
+                done = {json.loads(line)["custom_id"] for line in f if line.endswith("\n")}
+        with open(os.path.join(batch_dir, "input.jsonl"), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        total = len(requests)
+        counts = {"completed": 0, "failed": 0}
+        lock = threading.Lock()
+
+        def run(request):
+            try:
+                body = self.respond(request["body"])
+                line = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": body}, "error": None}
+                outcome = "completed"
+            except Exception as e:
+                line = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                        "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+                outcome = "failed"
+            with lock:
+                output.write(json.dumps(line) + "\n")
+                output.flush()
+                counts[outcome] += 1
+                self._write_status(batch_id, {"status": "in_progress", "total": total, **counts})
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            todo = [request for request in requests if request["custom_id"] not in done]
+            counts["completed"] = total - len(todo)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(run, todo))
+        self._write_status(batch_id, {"status": "completed", "total": total, **counts})
+
+    def submit(self, path):
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        os.makedirs(self._dir(batch_id))
+        shutil.copyfile(path, os.path.join(self._dir(batch_id), "input.jsonl"))
+        self._write_status(batch_id, {"status": "in_progress", "total": 0, "completed": 0, "failed": 0})
+        self._ensure_running(batch_id)
+        return batch_id
+
+    def status(self, batch_id):
+        status = self._read_status(batch_id)
+        if status["status"] not in TERMINAL_STATUSES:
+            self._ensure_running(batch_id)
+        return status
+
+    def download(self, batch_id, path):
+        shutil.copyfile(os.path.join(self._dir(batch_id), "output.jsonl"), path)
+
+
+def forward_to(client):
+    """`respond` function for LocalBatchBackend that sends each request to `client`'s chat completions endpoint."""
+    def respond(body):
+        return client.chat.completions.create(**body).model_dump()
+    return respond
+
+
+def ingest_batch_output(path, model, cache=None):
+    """
+    Store the successful responses of a batch output file in the response cache.
+
+    Returns:
+        Tuple[int, Dict[str, Any]]: Number of stored responses, and the error of every failed request by key.
+    """
+    cache = cache or get_response_cache()
+    stored = 0
+    errors = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response")
+            if response is not None and response.get("status_code") == 200:
+                cache.put(entry["custom_id"], response["body"]["choices"][0]["message"]["content"], model=model)
+                stored += 1
+            else:
+                errors[entry["custom_id"]] = entry.get("error") or {"status_code": response and response.get("status_code")}
+    return stored, errors
+
+
+class BatchRunner:
+    """
+    Fills the response cache for a list of inputs through a batch backend.
+
+    Requests already in the cache are skipped and duplicates are sent once. Batch ids are kept in
+    `work_dir/state.json`, so a restarted run waits for the batches it already submitted instead of
+    sending them again. Requests that fail in the batch stay uncached and are sent synchronously by
+    `llm_generate` afterwards.
+
+    Args:
+        backend: OpenAIBatchBackend, LocalBatchBackend or any object with submit/status/download.
+        work_dir (str): Directory for batch input/output files and the state file.
+        poll_interval (float): Seconds between two status checks.
+        timeout (float, optional): Give up waiting after this many seconds; unfinished requests are then sent synchronously.
+        max_requests (int): Maximum requests per batch file.
+        max_bytes (int): Maximum size of a batch file.
+    """
+
+    def __init__(self, backend, work_dir, poll_interval=30.0, timeout=None, max_requests=50000, max_bytes=190 * 1024 * 1024):
+        self.backend = backend
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.state_path = os.path.join(work_dir, "state.json")
+        os.makedirs(work_dir, exist_ok=True)
+        self.state = {"batches": []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.state = json.load(f)
+
+    def _save_state(self):
+        with open(f"{self.state_path}.tmp", "w") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def _write_batches(self, inputs, model, temp, top_p, seeds, cache, endpoint_model=None):
+        """
+        Write batch input files for the uncached requests. Returns the paths and the number of requests.
+
+        Requests are keyed by `model` in the cache but name `endpoint_model` in their body when it is given.
+        """
+        paths = []
+        seen = set()
+        f = None
+        count = size = 0
+        try:
+            for input_dict, seed in zip(inputs, seeds):
+                system_prompt, user_message = input_dict["system_prompt"], input_dict["user_message"]
+                key = cache_key(model, temp, top_p, seed, system_prompt, user_message)
+                if key in seen or key in cache:
+                    continue
+                seen.add(key)
+                request = {"system_prompt": system_prompt, "user_message": user_message}
+                line = json.dumps({
+                    "custom_id": key,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": chat_body(request, endpoint_model or model, temp, top_p, seed),
+                }) + "\n"
+                data = line.encode("utf-8")
+                if f is None or count >= self.max_requests or size + len(data) > self.max_bytes:
+                    if f is not None:
+                        f.close()
+                    paths.append(os.path.join(self.work_dir, f"input_{int(time.time())}_{len(paths)}.jsonl"))
+                    f = open(paths[-1], "wb")
+                    count = size = 0
+                f.write(data)
+                count += 1
+                size += len(data)
+        finally:
+            if f is not None:
+                f.close()
+        return paths, len(seen)
+
+    def _wait(self, model, cache, mute_tqdm):
+        """Poll the batches that are not ingested yet until they finish or the timeout expires."""
+        active = [batch for batch in self.state["batches"] if not batch.get("ingested")]
+        start = time.monotonic()
+        progress = tqdm.tqdm(total=len(active), disable=mute_tqdm, desc=f"Batches {model}", leave=False)
+        stats = {"stored": 0, "failed": 0}
+        with progress:
+            while active:
+                for batch in list(active):
+                    status = self.backend.status(batch["id"])
+                    batch["status"] = status["status"]
+                    if status["status"] not in TERMINAL_STATUSES:
+                        continue
+                    output_path = os.path.join(self.work_dir, f"{batch['id']}.output.jsonl")
+                    if status["status"] == "completed" or status.get("completed"):
+                        self.backend.download(batch["id"], output_path)
+                        stored, errors = ingest_batch_output(output_path, batch.get("model", model), cache)
+                        stats["stored"] += stored
+                        stats["failed"] += len(errors)
+                    batch["ingested"] = True
+                    active.remove(batch)
+                    progress.update(1)
+                self._save_state()
+                if not active:
+                    break
+                if self.timeout is not None and time.monotonic() - start > self.timeout:
+                    break
+                time.sleep(self.poll_interval)
+        stats["unfinished"] = len(active)
+        return stats
+
+    def run(self, inputs, model="gpt-4o-mini", temp=0.1, top_p=0.9, seed=42, seeds=None, mute_tqdm=False, endpoint_model=None):
+        """
+        Make sure the response cache holds a response for every input, as far as the batch backend allows.
+
+        Sampling arguments must match those later passed to `llm_generate`, since they are part of the cache key.
+        `endpoint_model` is the name of `model` at the backend's endpoint, when it differs (see `Endpoint.model_name`).
+
+        Returns:
+            Dict[str, int]: Requests submitted, responses stored, failed requests and unfinished batches.
+        """
+        cache = get_response_cache()
+        seeds = seeds if seeds is not None else [seed] * len(inputs)
+        # Batches submitted by an earlier run are collected first, so their requests are not sent twice
+        stats = self._wait(model, cache, mute_tqdm)
+        paths, submitted = self._write_batches(inputs, model, temp, top_p, seeds, cache, endpoint_model)
+        for path in paths:
+            self.state["batches"].append({"id": self.backend.submit(path), "input": path, "model": model, "status": "submitted"})
+            self._save_state()
+        new_stats = self._wait(model, cache, mute_tqdm)
+        return {
+            "submitted": submitted,
+            "stored": stats["stored"] + new_stats["stored"],
+            "failed": stats["failed"] + new_stats["failed"],
+            "unfinished": new_stats["unfinished"],
+        }
+
+
+def make_batch_backend(kind, client, root):
+    """
+    Build a batch backend: "openai" uses the provider's Batch API through `client`; "local" runs batches
+    from `root` on this machine, sending each request to `client` (e.g. a local server or the mock server).
+    """
+    if kind == "openai":
+        return OpenAIBatchBackend(client)
+    if kind == "local":
+        return LocalBatchBackend(root, forward_to(client))
+    raise ValueError(f"Unknown batch backend: {kind}")
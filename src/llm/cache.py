@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+def cache_key(model, temp, top_p, seed, system_prompt, user_message, options=None):
+    """
+    Content-addressed key of one generation request.
+
+    Every field is length-prefixed before hashing, so distinct requests cannot collide by concatenation.
+    `options` holds generation options that change the response, such as an output-token cap; they are
+    only part of the key when set, so keys of requests without options stay the same.
+
+    Returns:
+        str: Hex digest identifying the request.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    fields = [model, repr(temp), repr(top_p), repr(seed), system_prompt, user_message]
+    if options:
+        fields.append(json.dumps(options, sort_keys=True))
+    for field in fields:
+        data = field.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed store of LLM responses, safe to share between threads and processes.
+
+    The database runs in WAL mode so readers never block writers. Each thread uses its own connection.
+    When `max_bytes` is set, least recently used entries are evicted as the cache grows past it.
+    Lookups only read: access times and hit counts are collected in memory and written in one transaction
+    once `access_flush_every` keys are pending or `access_flush_interval` seconds have passed, before
+    eviction and stats, and by `flush_access`.
+    """
+
+    MISS = object()
+
+    def __init__(self, path, max_bytes=None, evict_every=256, access_flush_every=256, access_flush_interval=30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.access_flush_every = access_flush_every
+        self.access_flush_interval = access_flush_interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "writes": 0}
+        # key -> [last access time, hits], not written to the database yet
+        self.pending_access = {}
+        self.access_flushed = time.monotonic()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+            return self.counters[name]
+
+    def get(self, key, default=None):
+        """
+        Return the cached response for `key`, or `default` if there is none.
+        """
+        conn = self._connection()
+        row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return default
+        self._count("hits")
+        self._note_access(key)
+        return row[0]
+
+    def _note_access(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.pending_access.get(key)
+            if entry is None:
+                self.pending_access[key] = [now, 1]
+            else:
+                entry[0] = now
+                entry[1] += 1
+            due = (
+                len(self.pending_access) >= self.access_flush_every
+                or time.monotonic() - self.access_flushed >= self.access_flush_interval
+            )
+        if due:
+            try:
+                self.flush_access()
+            except sqlite3.Error:
+                # Access times only order eviction; a busy database must not fail the lookup
+                pass
+
+    def flush_access(self):
+        """
+        Write the access times and hit counts collected since the last flush, in one transaction.
+
+        Returns:
+            int: Number of updated keys.
+        """
+        with self.lock:
+            pending, self.pending_access = self.pending_access, {}
+            self.access_flushed = time.monotonic()
+        if not pending:
+            return 0
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE responses SET accessed = MAX(accessed, ?), hits = hits + ? WHERE key = ?",
+                [(accessed, hits, key) for key, (accessed, hits) in pending.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(pending)
+
+    def __contains__(self, key):
+        row = self._connection().execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def put(self, key, response, model=None):
+        """
+        Store `response` under `key`, replacing any previous entry.
+        """
+        now = time.time()
+        size = len(response.encode("utf-8")) if response is not None else 0
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, size, now, now),
+        )
+        if self.max_bytes is not None and self._count("writes") % self.evict_every == 0:
+            self.evict(max_bytes=self.max_bytes)
+
+    def evict(self, max_bytes=None, max_entries=None):
+        """
+        Delete least recently used entries until the cache fits within the given limits.
+
+        Args:
+            max_bytes (int, optional): Maximum total size of stored responses.
+            max_entries (int, optional): Maximum number of stored responses.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        self.flush_access()
+        conn = self._connection()
+        deleted = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            excess_entries = entries - max_entries if max_entries is not None else 0
+            excess_bytes = total - max_bytes if max_bytes is not None else 0
+            if excess_entries > 0 or excess_bytes > 0:
+                stale = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if excess_entries <= 0 and excess_bytes <= 0:
+                        break
+                    stale.append((key,))
+                    excess_entries -= 1
+                    excess_bytes -= size
+                conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                deleted = len(stale)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def stats(self):
+        """
+        Return entry count, stored bytes and per-model counts, plus hit/miss counters of this process.
+        """
+        self.flush_access()
+        conn = self._connection()
+        entries, total, hits = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses"
+        ).fetchone()
+        models = dict(conn.execute("SELECT model, COUNT(*) FROM responses GROUP BY model").fetchall())
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "lifetime_hits": hits,
+            "models": models,
+            "session_hits": counters["hits"],
+            "session_misses": counters["misses"],
+            "session_hit_rate": counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    def export_jsonl(self, path):
+        """
+        Write every entry to a JSONL file. Returns the number of exported entries.
+        """
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for key, model, response, created in self._connection().execute(
+                "SELECT key, model, response, created FROM responses ORDER BY created"
+            ):
+                f.write(json.dumps({"key": key, "model": model, "response": response, "created": created}) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, path, overwrite=False):
+        """
+        Load entries written by `export_jsonl`. Existing keys are kept unless `overwrite` is True.
+
+        Returns:
+            int: Number of imported entries.
+        """
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        conn = self._connection()
+        count = 0
+        conn.execute("BEGIN")
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    response = entry["response"]
+                    size = len(response.encode("utf-8")) if response is not None else 0
+                    now = time.time()
+                    cursor = conn.execute(
+                        f"{verb} INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                        (entry["key"], entry.get("model"), response, size, entry.get("created", now), now),
+                    )
+                    count += cursor.rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return the process-wide response cache.
+
+    Location and size limit come from `LLM_CACHE_PATH` (default `.cache/responses.sqlite`)
+    and `LLM_CACHE_MAX_BYTES` (default unlimited).
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            max_bytes = os.environ.get("LLM_CACHE_MAX_BYTES")
+            _default_cache = ResponseCache(
+                os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "responses.sqlite")),
+                max_bytes=int(max_bytes) if max_bytes else None,
+            )
+            # Access times collected since the last flush would otherwise be lost at exit
+            atexit.register(_default_cache.flush_access)
+        return _default_cache
+
+
+def set_response_cache(cache):
+    """
+    Replace the process-wide response cache, e.g. with a fresh cache for a benchmark run.
+
+    Args:
+        cache (ResponseCache or None): The new cache; None re-creates the default one on next use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.llm.cache stats | evict <max_bytes> | export <path> | import <path>
+    cache = get_response_cache()
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        print(json.dumps(cache.stats(), indent=4))
+    elif command == "evict":
+        print(f"Evicted {cache.evict(max_bytes=int(sys.argv[2]))} entries.")
+    elif command == "export":
+        print(f"Exported {cache.export_jsonl(sys.argv[2])} entries.")
+    elif command == "import":
+        print(f"Imported {cache.import_jsonl(sys.argv[2])} entries.")
+    else:
+        sys.exit(f"Unknown command: {command}")
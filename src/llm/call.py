@@ -1,29 +1,62 @@
 import os
+import time
+import threading
 import tqdm
-from openai import OpenAI
-from joblib import Memory
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
+    wait_random_exponential,
+    retry_if_exception,
 )
+from src.llm.rate_limit import get_rate_limiter, estimate_tokens, is_retryable, get_retry_after
+from src.llm.cache import ResponseCache, get_response_cache, cache_key
+from src.llm.batch import chat_body
+from src.llm.schedule import TokenScheduler, DEFAULT_BUCKET_BOUNDS
+from src.llm.telemetry import get_telemetry, current_request, note_retry
+from src.llm.pool import pool_from_env
 
-# Load environment variables from a .env file 
-load_dotenv()
+_pool = None
+_pool_lock = threading.Lock()
 
-# Set up caching for function results to avoid redundant API calls
-memory = Memory(location=".cache", verbose=0)
+def get_pool():
+    """
+    Return the process-wide endpoint pool (see `src.llm.pool`), created on first use.
+
+    openai and dotenv are imported here rather than at module import, so that scripts which never
+    reach the API (--help, dry runs, scoring from the cache) start quickly and need no API key.
+    Endpoints come from `LLM_ENDPOINTS`, or else from `YOUR_OPENAI_API_KEY` and `YOUR_OPENAI_API_BASE_URL`,
+    after loading the `.env` file.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from dotenv import load_dotenv
+
+            # Load environment variables from a .env file
+            load_dotenv()
+            _pool = pool_from_env()
+        return _pool
+
+def set_pool(pool):
+    """Replace the process-wide endpoint pool; None re-creates it from the environment on next use."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
 
-# Initialize the OpenAI client with API key and base URL
-client = OpenAI(api_key=os.environ.get("YOUR_OPENAI_API_KEY"), base_url=os.environ.get("YOUR_OPENAI_API_BASE_URL"))
-# client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def get_endpoint(model):
+    """
+    Return the endpoint of the pool serving `model`, for APIs other than chat completions (e.g. batches).
+
+    Its client is `endpoint.get_client()` and the model name it expects is `endpoint.model_name(model)`.
+    """
+    return get_pool().endpoint_for(model)
 
 def retry_callback(retry_state):
     """
     Callback function for retry logic, providing feedback on retry attempts and exceptions.
     """
+    note_retry(retry_state.outcome.exception())
     print(
         f"Retrying {retry_state.fn.__name__} due to {retry_state.outcome.exception()}."
     )
@@ -31,50 +64,400 @@ def retry_callback(retry_state):
         f"Attempt {retry_state.attempt_number} of {retry_state.retry_object.stop.max_attempt_number}."
     )
 
+_backoff = wait_random_exponential(multiplier=1, max=64)
+
+def wait_retry_after(retry_state):
+    """
+    Wait strategy honouring the provider's Retry-After header, with jittered exponential backoff otherwise.
+    """
+    retry_after = get_retry_after(retry_state.outcome.exception())
+    delay = retry_after if retry_after is not None else _backoff(retry_state)
+    # Never sleep past the request's deadline; the next attempt then returns at once
+    remaining = _remaining(retry_state.kwargs.get("deadline_at"))
+    return delay if remaining is None else max(0.0, min(delay, remaining))
+
+def _remaining(deadline_at):
+    """Seconds left before `deadline_at` (a time.monotonic() value), or None without a deadline."""
+    return None if deadline_at is None else deadline_at - time.monotonic()
+
+def _past_deadline(deadline_at):
+    remaining = _remaining(deadline_at)
+    return remaining is not None and remaining <= 0
+
+def _give_up(text=""):
+    """Result of a request stopped by its deadline: the text received so far and the "deadline" finish reason."""
+    record = current_request()
+    if record is not None:
+        record["finish_reason"] = "deadline"
+    return text, "deadline"
+
+
+def _cut_stream(response):
+    """Interrupt a stream blocked waiting for its next chunk by shutting its socket down."""
+    import socket
+
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
 @retry(
     reraise=True,  # Reraise the last exception if all retries are exhausted
     stop=stop_after_attempt(32),  # Maximum of 32 retry attempts
-    wait=wait_exponential(min=16, max=64),  # Exponential backoff between 16 to 64 seconds
-    retry=retry_if_exception_type(Exception),  # Retry for any exception
+    wait=wait_retry_after,  # Retry-After if given, else jittered exponential backoff up to 64 seconds
+    retry=retry_if_exception(is_retryable),  # Only retry errors that can succeed on retry
     before_sleep=retry_callback,  # Call the callback function before each retry
 )
-@memory.cache  # Cache the results of the function to avoid redundant API calls
+def _chat_completion(input_dict, model, temp, top_p, seed, max_tokens=None, deadline_at=None):
+    """
+    Send one chat completion request through the rate limiter of the chosen endpoint and model, with retries.
+
+    `max_tokens` caps the output and is only sent when set. `deadline_at` (a time.monotonic() value) is the
+    budget of all attempts together: each attempt times out when it is reached, and once it has passed the
+    request is given up without retrying.
+
+    Returns:
+        Tuple[str, str]: The response and the provider's finish reason, or ("", "deadline") past the deadline.
+    """
+    import openai
+
+    if _past_deadline(deadline_at):
+        return _give_up()
+    record = current_request()
+    options = {}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    try:
+        with get_pool().acquire(model) as (endpoint, client, endpoint_model):
+            rate_limiter = get_rate_limiter(model, endpoint.name)
+            start = time.perf_counter()
+            with rate_limiter.request(tokens=estimate_tokens(input_dict)):
+                sent = time.perf_counter()
+                if _past_deadline(deadline_at):
+                    if record is not None:
+                        record["queue_wait"] += sent - start
+                    return _give_up()
+                if deadline_at is not None:
+                    options["timeout"] = _remaining(deadline_at)
+                if record is not None:
+                    record["endpoint"] = endpoint.name
+                try:
+                    chat_completion = client.chat.completions.create(
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": input_dict["system_prompt"],
+                            },
+                            {
+                                "role": "user",
+                                "content": input_dict["user_message"],
+                            },
+                        ],
+                        model=endpoint_model,
+                        temperature=temp,
+                        top_p=top_p,
+                        seed=seed,
+                        **options,
+                    )
+                except openai.RateLimitError as e:
+                    rate_limiter.record_throttle(get_retry_after(e))
+                    raise
+                finally:
+                    if record is not None:
+                        record["queue_wait"] += sent - start
+                        record["api_latency"] += time.perf_counter() - sent
+            rate_limiter.record_success()
+    except Exception as e:
+        # A timeout or throttle at the deadline ends the request instead of being retried
+        if is_retryable(e) and _past_deadline(deadline_at):
+            return _give_up()
+        raise
+    finish_reason = chat_completion.choices[0].finish_reason
+    if record is not None:
+        record["finish_reason"] = finish_reason
+        if chat_completion.usage is not None:
+            record["prompt_tokens"] = chat_completion.usage.prompt_tokens
+            record["completion_tokens"] = chat_completion.usage.completion_tokens
+    return chat_completion.choices[0].message.content, finish_reason
+
+@retry(
+    reraise=True,
+    stop=stop_after_attempt(32),
+    wait=wait_retry_after,
+    retry=retry_if_exception(is_retryable),
+    before_sleep=retry_callback,
+)
+def _chat_completion_stream(input_dict, model, temp, top_p, seed, max_tokens=None, stop_condition=None, deadline_at=None):
+    """
+    Stream one chat completion through the rate limiter of the chosen endpoint and model, with retries, closing the stream early when possible.
+
+    The stream is closed as soon as `stop_condition` finds the answer complete, and the text is cut at the
+    offset it returns. It is also closed when `deadline_at` (a time.monotonic() value, the budget of all attempts
+    together) is reached, even if no chunk arrives, keeping the text received so far; no attempt is retried past it.
+    Either way the worker is freed without waiting for the rest of the output.
+    The time to first token and the generation time after it are recorded in the current request.
+
+    Returns:
+        Tuple[str, str]: The response, and why it ended: the provider's finish reason ("stop", "length", ...),
+        "stop_condition" or "deadline".
+    """
+    import openai
+
+    if _past_deadline(deadline_at):
+        return _give_up()
+    record = current_request()
+    text = ""
+    finish_reason = None
+    usage = None
+    first_token = None
+    watchdog = None
+    try:
+        with get_pool().acquire(model) as (endpoint, client, endpoint_model):
+            rate_limiter = get_rate_limiter(model, endpoint.name)
+            start = time.perf_counter()
+            with rate_limiter.request(tokens=estimate_tokens(input_dict)):
+                sent = time.perf_counter()
+                if _past_deadline(deadline_at):
+                    if record is not None:
+                        record["queue_wait"] += sent - start
+                    return _give_up()
+                if record is not None:
+                    record["endpoint"] = endpoint.name
+                try:
+                    stream = client.chat.completions.create(
+                        **chat_body(input_dict, endpoint_model, temp, top_p, seed, max_tokens),
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        timeout=_remaining(deadline_at),
+                    )
+                    if deadline_at is not None:
+                        # Closes a stalled stream at the deadline; the read then fails and the request ends below
+                        watchdog = threading.Timer(max(0.0, _remaining(deadline_at)), _cut_stream, (stream.response,))
+                        watchdog.daemon = True
+                        watchdog.start()
+                    # Leaving the block closes the connection, which stops the generation
+                    with stream:
+                        for chunk in stream:
+                            if chunk.usage is not None:
+                                usage = chunk.usage
+                            if not chunk.choices:
+                                continue
+                            choice = chunk.choices[0]
+                            if choice.finish_reason is not None:
+                                finish_reason = choice.finish_reason
+                            if choice.delta.content:
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                text += choice.delta.content
+                                end = stop_condition(text) if stop_condition is not None else None
+                                if end is not None:
+                                    text = text[:end]
+                                    finish_reason = "stop_condition"
+                                    break
+                            if _past_deadline(deadline_at):
+                                finish_reason = "deadline"
+                                break
+                except openai.RateLimitError as e:
+                    rate_limiter.record_throttle(get_retry_after(e))
+                    raise
+                finally:
+                    if watchdog is not None:
+                        watchdog.cancel()
+                    finished = time.perf_counter()
+                    if record is not None:
+                        record["queue_wait"] += sent - start
+                        record["api_latency"] += finished - sent
+            rate_limiter.record_success()
+    except Exception:
+        # A stream cut or timed out at the deadline ends the request with its text so far, without retrying
+        if _past_deadline(deadline_at):
+            return _give_up(text)
+        raise
+    if record is not None:
+        record["finish_reason"] = finish_reason
+        if first_token is not None:
+            record["ttft"] = first_token - sent
+            record["generation_time"] = finished - first_token
+        if usage is not None:
+            record["prompt_tokens"] = usage.prompt_tokens
+            record["completion_tokens"] = usage.completion_tokens
+    return text, finish_reason
+
+def generation_options(max_tokens=None, stop_condition=None):
+    """Options that change the response of a request, as stored in its cache key; empty when none is set."""
+    options = {}
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    if stop_condition is not None:
+        options["stop_condition"] = stop_condition.__name__
+    return options
+
 def llm_single_generate(
     input_dict,
     model="gpt-4o-mini",
     temp=0.1,
     top_p=0.9,
     seed=42,
+    telemetry=None,
+    stream=False,
+    max_tokens=None,
+    stop_condition=None,
+    deadline=None,
 ):
     """
     Generate a single response using the GPT model.
 
+    Responses are stored in the shared response cache (see `src.llm.cache`), keyed by the model,
+    sampling parameters, both prompts and the output cap and stop condition when set, so repeated
+    requests never reach the API.
+    Each call is recorded in `telemetry` (see `src.llm.telemetry`): cache hit or miss, rate limiter
+    wait, API time, token usage, retries, finish reason and, when streaming, the time to first token.
+
+    With `stream`, the response is streamed and the request ends as soon as `stop_condition` finds the
+    answer complete (see `_chat_completion_stream`). Without it, `stop_condition` cuts the full response
+    at the same place. `deadline` is the time budget of the request, retries included: once it has passed
+    the request ends with the text received so far (empty without streaming) instead of being retried.
+    Responses cut by the deadline depend on timing, so they are returned but not cached.
+
     Args:
         input_dict (Dict[str, str]): Dictionary containing 'system_prompt' and 'user_message'.
         model (str, optional): Name of the model to use. Defaults to "gpt-4o-mini".
-        temp (float, optional): Temperature setting for response generation. Defaults to 0.0.
+        temp (float, optional): Temperature setting for response generation. Defaults to 0.1.
         top_p (float, optional): Nucleus sampling parameter. Defaults to 0.9.
+        seed (int, optional): Sampling seed passed to the provider. Defaults to 42.
+        telemetry (Telemetry, optional): Where the request is recorded. Defaults to the process-wide in-memory telemetry.
+        stream (bool, optional): Whether to stream the response. Defaults to False.
+        max_tokens (int, optional): Output-token cap sent to the provider. Defaults to no cap.
+        stop_condition (Callable[[str], Optional[int]], optional): Offset where the text generated so far is a
+            complete answer, or None (see `src.metric.base.end_of_list`). Defaults to never stopping early.
+        deadline (float, optional): Seconds after which a request is cancelled, counted from its first attempt. Defaults to no deadline.
 
     Returns:
         str: Response generated by the model.
     """
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "system",
-                "content": input_dict["system_prompt"],
-            },
-            {
-                "role": "user",
-                "content": input_dict["user_message"],
-            },
-        ],
-        model=model,
-        temperature=temp,
-        top_p=top_p,
-        seed=seed,
+    # Materialize the prompt once; lazy inputs format their user message on every access
+    request = {
+        "system_prompt": input_dict["system_prompt"],
+        "user_message": input_dict["user_message"],
+        "token_length": input_dict.get("token_length"),
+    }
+    with (telemetry or get_telemetry()).track(model) as record:
+        cache = get_response_cache()
+        options = generation_options(max_tokens, stop_condition)
+        key = cache_key(model, temp, top_p, seed, request["system_prompt"], request["user_message"], options)
+        response = cache.get(key, ResponseCache.MISS)
+        if response is ResponseCache.MISS:
+            deadline_at = time.monotonic() + deadline if deadline is not None else None
+            if stream:
+                response, finish_reason = _chat_completion_stream(
+                    request, model, temp, top_p, seed, max_tokens, stop_condition, deadline_at=deadline_at,
+                )
+            else:
+                response, finish_reason = _chat_completion(request, model, temp, top_p, seed, max_tokens, deadline_at=deadline_at)
+                end = stop_condition(response) if stop_condition is not None and response is not None else None
+                if end is not None:
+                    response = response[:end]
+            if finish_reason != "deadline":
+                cache.put(key, response, model=model)
+        else:
+            record["cache"] = "hit"
+    return response
+
+def llm_generate_iter(
+    inputs,
+    model="gpt-4o-mini",
+    temp=0.1,
+    top_p=0.9,
+    mute_tqdm=False,
+    seed=42,
+    max_workers=1,
+    seeds=None,
+    schedule="longest_first",
+    bucket_bounds=DEFAULT_BUCKET_BOUNDS,
+    bucket_caps=None,
+    telemetry=None,
+    stream=False,
+    max_tokens=None,
+    stop_condition=None,
+    deadline=None,
+):
+    """
+    Generate responses for a list of inputs, yielding them as they complete.
+
+    At most `max_workers` requests are in flight at any time. Each request goes through
+    `llm_single_generate`, so the cache and retry wrappers apply to every input.
+
+    With several workers, requests are dispatched by estimated prompt size (see `src.llm.schedule`):
+    the largest first by default, so one huge prompt does not start last and stretch the run, and at
+    most `bucket_caps[b]` requests of size bucket `b` run at once, bounding tokens in flight.
+
+    Args:
+        inputs (List[Dict[str, Any]]): List of dictionaries containing 'system_prompt' and 'user_message'.
+        model (str, optional): Name of the model to use. Defaults to "gpt-4o-mini".
+        temp (float, optional): Temperature setting for response generation. Defaults to 0.1.
+        top_p (float, optional): Nucleus sampling parameter. Defaults to 0.9.
+        mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        seed (int, optional): Sampling seed passed to the provider. Defaults to 42.
+        max_workers (int, optional): Maximum number of requests in flight. Defaults to 1.
+        seeds (List[int], optional): Per-input sampling seeds overriding `seed`, e.g. to interleave random seeds.
+        schedule (str, optional): "longest_first" or "fifo" (input order). Defaults to "longest_first".
+        bucket_bounds (Tuple[int], optional): Token counts splitting inputs into size buckets. Defaults to 64K and 128K.
+        bucket_caps (List[int], optional): Maximum requests in flight per size bucket, smallest first. Defaults to no caps.
+        telemetry (Telemetry, optional): Where requests are recorded, see `llm_single_generate`.
+        stream, max_tokens, stop_condition, deadline: Streaming and output limits of every request, see `llm_single_generate`.
+
+    Yields:
+        Tuple[int, str]: Index of the input in `inputs` and the generated response, in completion order.
+    """
+    kwargs = dict(
+        model=model, temp=temp, top_p=top_p, telemetry=telemetry,
+        stream=stream, max_tokens=max_tokens, stop_condition=stop_condition, deadline=deadline,
     )
-    return chat_completion.choices[0].message.content
+    seeds = seeds if seeds is not None else [seed] * len(inputs)
+    progress = tqdm.tqdm(
+        total=len(inputs),
+        disable=mute_tqdm,  # Option to mute the progress bar
+        desc=f"Inference {model}",  # Description shown in the progress bar
+        leave=False,  # Remove the progress bar after completion
+    )
+
+    with progress:
+        if max_workers <= 1:
+            for idx, input_dict in enumerate(inputs):
+                response = llm_single_generate(input_dict, seed=seeds[idx], **kwargs)
+                progress.update(1)
+                yield idx, response
+            return
+
+        if schedule not in ("longest_first", "fifo"):
+            raise ValueError(f"Unknown schedule: {schedule}")
+        scheduler = TokenScheduler(
+            [estimate_tokens(input_dict) for input_dict in inputs],
+            bounds=bucket_bounds,
+            caps=bucket_caps,
+            longest_first=schedule == "longest_first",
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submit lazily so that only `max_workers` inputs are materialized at once
+            pending = {}
+            while pending or len(scheduler):
+                while len(pending) < max_workers:
+                    idx = scheduler.next()
+                    if idx is None:
+                        break
+                    pending[executor.submit(llm_single_generate, inputs[idx], seed=seeds[idx], **kwargs)] = idx
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = pending.pop(future)
+                    scheduler.done(idx)
+                    progress.update(1)
+                    yield idx, future.result()
 
 def llm_generate(
     inputs,
@@ -82,7 +465,15 @@ def llm_generate(
     temp=0.1,
     top_p=0.9,
     mute_tqdm=False,
-    seed=42
+    seed=42,
+    max_workers=1,
+    schedule="longest_first",
+    bucket_caps=None,
+    telemetry=None,
+    stream=False,
+    max_tokens=None,
+    stop_condition=None,
+    deadline=None,
 ):
     """
     Generate responses for a list of inputs using the GPT model.
@@ -90,29 +481,38 @@ def llm_generate(
     Args:
         inputs (List[Dict[str, Any]]): List of dictionaries containing 'system_prompt' and 'user_message'.
         model (str, optional): Name of the model to use. Defaults to "gpt-4o-mini".
-        temp (float, optional): Temperature setting for response generation. Defaults to 0.0.
+        temp (float, optional): Temperature setting for response generation. Defaults to 0.1.
         top_p (float, optional): Nucleus sampling parameter. Defaults to 0.9.
         mute_tqdm (bool, optional): Whether to disable the tqdm progress bar. Defaults to False.
+        seed (int, optional): Sampling seed passed to the provider. Defaults to 42.
+        max_workers (int, optional): Maximum number of requests in flight. Defaults to 1 (sequential).
+        schedule (str, optional): Dispatch order with several workers, "longest_first" or "fifo". Defaults to "longest_first".
+        bucket_caps (List[int], optional): Maximum requests in flight per size bucket, see `llm_generate_iter`.
+        telemetry (Telemetry, optional): Where requests are recorded, see `llm_single_generate`.
+        stream, max_tokens, stop_condition, deadline: Streaming and output limits of every request, see `llm_single_generate`.
 
     Returns:
-        List[str]: List of responses generated by the model.
+        List[str]: List of responses generated by the model, in the same order as `inputs`.
     """
-    responses = []
+    responses = [None] * len(inputs)
 
-    for input_dict in tqdm.tqdm(
+    for idx, response in llm_generate_iter(
         inputs,
-        disable=mute_tqdm,  # Option to mute the progress bar
-        desc=f"Inference {model}",  # Description shown in the progress bar
-        leave=False,  # Remove the progress bar after completion
+        model=model,
+        temp=temp,
+        top_p=top_p,
+        mute_tqdm=mute_tqdm,
+        seed=seed,
+        max_workers=max_workers,
+        schedule=schedule,
+        bucket_caps=bucket_caps,
+        telemetry=telemetry,
+        stream=stream,
+        max_tokens=max_tokens,
+        stop_condition=stop_condition,
+        deadline=deadline,
     ):
-        response = llm_single_generate(
-            input_dict,
-            model=model,
-            temp=temp,
-            top_p=top_p,
-            seed=seed,
-        )
-        responses.append(response)
+        responses[idx] = response
 
     return responses
 
@@ -0,0 +1,268 @@
+"""Local OpenAI-compatible chat completions server for offline benchmarks of the inference path."""
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+
+
+class MockConfig:
+    """
+    Behaviour of the mock server.
+
+    Args:
+        latency (str): Latency distribution, one of LATENCY_DISTRIBUTIONS.
+        latency_ms (float): Mean latency in milliseconds.
+        jitter (float): Spread of the distribution relative to the mean (uniform half-width, lognormal sigma).
+        ms_per_1k_prompt_tokens (float): Extra latency per 1K prompt tokens (chars / 4), to mimic long prompts.
+        rate_429 (float): Fraction of requests answered with 429.
+        rate_5xx (float): Fraction of requests answered with 500/502/503.
+        retry_after_ms (float, optional): `retry-after-ms` header sent with injected errors.
+        response_words (int): Number of words in the list of each completion.
+        trailing_words (int): Number of words of commentary after the list, as some models add.
+        ms_per_output_token (float): Delay between two output tokens; the sampled latency is the time to first token.
+        seed (int, optional): Seed of the server's random generator.
+    """
+
+    def __init__(self, latency="lognormal", latency_ms=200.0, jitter=0.5, ms_per_1k_prompt_tokens=0.0,
+                 rate_429=0.0, rate_5xx=0.0, retry_after_ms=50.0, response_words=32, trailing_words=0,
+                 ms_per_output_token=0.0, seed=None):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.ms_per_1k_prompt_tokens = ms_per_1k_prompt_tokens
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after_ms = retry_after_ms
+        self.response_words = response_words
+        self.trailing_words = trailing_words
+        self.ms_per_output_token = ms_per_output_token
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def sample_latency(self, prompt_tokens):
+        """Return the delay of one response in seconds."""
+        with self.rng_lock:
+            mean = self.latency_ms
+            if self.latency == "constant":
+                delay = mean
+            elif self.latency == "uniform":
+                delay = self.rng.uniform(mean * (1 - self.jitter), mean * (1 + self.jitter))
+            elif self.latency == "exponential":
+                delay = self.rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+            else:
+                # Lognormal with the requested mean: mu = ln(mean) - sigma^2 / 2
+                sigma = self.jitter
+                delay = self.rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma) if mean > 0 else 0.0
+        return max(0.0, delay + self.ms_per_1k_prompt_tokens * prompt_tokens / 1000.0) / 1000.0
+
+    def sample_error(self):
+        """Return the status code of an injected error, or None."""
+        with self.rng_lock:
+            draw = self.rng.random()
+            if draw < self.rate_429:
+                return 429
+            if draw < self.rate_429 + self.rate_5xx:
+                return self.rng.choice((500, 502, 503))
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, body, tokens, finish_reason, prompt_tokens):
+        """Send the tokens as server-sent events, one chunk per token, like a streaming provider."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {
+            "id": f"chatcmpl-mock-{self.server.stats['requests']}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+        }
+        chunks = [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None} for token in tokens]
+        chunks.append({"index": 0, "delta": {}, "finish_reason": finish_reason})
+        try:
+            for i, choice in enumerate(chunks):
+                if 0 < i < len(tokens):
+                    time.sleep(self.server.config.ms_per_output_token / 1000.0)
+                self.wfile.write(f"data: {json.dumps(dict(base, choices=[choice]))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+                self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            self.server.count("cancelled")
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        config = server.config
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+        server.count("requests")
+        time.sleep(config.sample_latency(prompt_tokens))
+
+        status = config.sample_error()
+        if status is not None:
+            server.count(str(status))
+            headers = [("retry-after-ms", str(config.retry_after_ms))] if config.retry_after_ms is not None else []
+            error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+            self._send_json(status, {"error": {"message": f"Injected {status}", "type": error_type}}, headers)
+            return
+
+        # One token per list item, bracket or trailing word; max_tokens cuts the output as a provider would
+        tokens = ["["] + [f"{', ' if i else ''}'item_{i}'" for i in range(config.response_words)] + ["]"]
+        tokens += [f" note_{i}" for i in range(config.trailing_words)]
+        finish_reason = "stop"
+        if body.get("max_tokens") is not None and len(tokens) > body["max_tokens"]:
+            tokens = tokens[:body["max_tokens"]]
+            finish_reason = "length"
+        completion_tokens = len(tokens)
+        server.count("completions")
+        if body.get("stream"):
+            self._send_stream(body, tokens, finish_reason, prompt_tokens)
+            return
+        time.sleep(config.ms_per_output_token * len(tokens) / 1000.0)
+        content = "".join(tokens)
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{server.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+class MockChatServer(ThreadingHTTPServer):
+    """
+    OpenAI-compatible `/v1/chat/completions` endpoint served from a background thread.
+
+    Usable as a context manager; point a client at `base_url`. `stats` counts received requests,
+    successful completions and every injected status code.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self.stats = {"requests": 0, "completions": 0}
+        self.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"requests": 0, "completions": 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser):
+    """Add the MockConfig options to an argparse parser."""
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal", help="Latency distribution.")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean latency in milliseconds.")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency spread relative to the mean.")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=0.0, help="Extra latency per 1K prompt tokens.")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with a 5xx error.")
+    parser.add_argument("--retry-after-ms", type=float, default=50.0, help="retry-after-ms header of injected errors.")
+    parser.add_argument("--response-words", type=int, default=32, help="Number of words in the list of each completion.")
+    parser.add_argument("--trailing-words", type=int, default=0, help="Number of words of commentary after the list.")
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0, help="Delay between two output tokens.")
+    parser.add_argument("--server-seed", type=int, default=None, help="Seed of the server's random generator.")
+
+
+def config_from_args(args):
+    """Build a MockConfig from arguments added by `add_config_arguments`."""
+    return MockConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        ms_per_1k_prompt_tokens=args.ms_per_1k_tokens,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        retry_after_ms=args.retry_after_ms,
+        response_words=args.response_words,
+        trailing_words=args.trailing_words,
+        ms_per_output_token=args.ms_per_output_token,
+        seed=args.server_seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible chat completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    server = MockChatServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Serving mock chat completions at {server.base_url} (set YOUR_OPENAI_API_BASE_URL to use it).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
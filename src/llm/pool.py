@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+
+STRATEGIES = ("least_loaded", "weighted")
+
+# Status codes that say the endpoint itself is failing: bad or revoked key, or a timeout on its side
+_ENDPOINT_STATUS_CODES = {401, 403, 408}
+
+
+def is_endpoint_failure(exception):
+    """
+    Return True for errors that count against the endpoint: timeouts, connection errors, 5xx and rejected keys.
+
+    429s are left to the rate limiter of the endpoint, which backs off without taking it out of rotation.
+    """
+    import openai
+
+    if isinstance(exception, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status_code = getattr(exception, "status_code", None)
+    return status_code in _ENDPOINT_STATUS_CODES or (status_code is not None and status_code >= 500)
+
+
+class Endpoint:
+    """
+    One OpenAI-compatible endpoint of a pool, with its own client and connection pool.
+
+    Args:
+        name (str): Name used in stats and telemetry.
+        base_url (str, optional): Base URL of the API; None for the provider default.
+        api_key (str, optional): API key of the endpoint.
+        models (Dict[str, str] or List[str], optional): Models served, as {alias: model name sent to the endpoint}
+            or a list of names sent unchanged. None serves every model under its own name.
+        weight (float): Share of the traffic relative to the other endpoints.
+        max_connections (int, optional): Size of the endpoint's connection pool. Defaults to the client's default.
+    """
+
+    def __init__(self, name, base_url=None, api_key=None, models=None, weight=1.0, max_connections=None):
+        if weight <= 0:
+            raise ValueError(f"Endpoint {name}: weight must be positive")
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.models = dict(zip(models, models)) if isinstance(models, list) else models
+        self.weight = weight
+        self.max_connections = max_connections
+        self.client = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "ejections": 0, "latency_seconds": 0.0}
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def model_name(self, model):
+        """Name of `model` (an alias) at this endpoint."""
+        return model if self.models is None else self.models[model]
+
+    def get_client(self):
+        """Return the endpoint's OpenAI client, created on first use. Retries are left to the caller."""
+        if self.client is None:
+            from openai import OpenAI, DefaultHttpxClient
+
+            http_client = None
+            if self.max_connections is not None:
+                import httpx
+
+                http_client = DefaultHttpxClient(limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections))
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=http_client)
+        return self.client
+
+
+class EndpointPool:
+    """
+    Routes requests over several endpoints and takes failing ones out of rotation for a while.
+
+    With the "least_loaded" strategy, a request goes to the healthy endpoint with the fewest requests
+    in flight relative to its weight; with "weighted", to a random healthy endpoint drawn by weight.
+    After `failure_threshold` consecutive failures (timeouts, connection errors, 5xx and rejected keys,
+    see `is_endpoint_failure`), an endpoint is ejected for `cooldown` seconds; it then gets requests again, and one
+    more failure ejects it again. If every endpoint serving a model is ejected, the one whose cooldown
+    ends first is used rather than failing the request.
+
+    Args:
+        endpoints (List[Endpoint]): Endpoints of the pool.
+        strategy (str): One of STRATEGIES. Defaults to "least_loaded".
+        failure_threshold (int): Consecutive failures that eject an endpoint.
+        cooldown (float): Seconds an ejected endpoint stays out of rotation.
+        seed (int, optional): Seed of the weighted draws.
+    """
+
+    def __init__(self, endpoints, strategy="least_loaded", failure_threshold=3, cooldown=30.0, seed=None):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        names = [endpoint.name for endpoint in endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate endpoint names: {names}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.turn = 0
+
+    def _choose(self, model):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+        if not candidates:
+            raise ValueError(f"No endpoint serves model {model}")
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in candidates if endpoint.ejected_until <= now]
+        if not healthy:
+            return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+        if self.strategy == "weighted":
+            return self.rng.choices(healthy, weights=[endpoint.weight for endpoint in healthy])[0]
+        # Rotate the starting point so ties are spread over the endpoints
+        self.turn += 1
+        offset = self.turn % len(healthy)
+        return min(healthy[offset:] + healthy[:offset], key=lambda endpoint: endpoint.in_flight / endpoint.weight)
+
+    def endpoint_for(self, model):
+        """
+        Return the first endpoint serving `model`, for requests that are not routed one by one (e.g. batches).
+
+        Healthy endpoints are preferred; send `endpoint.model_name(model)` as the model.
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+        if not candidates:
+            raise ValueError(f"No endpoint serves model {model}")
+        now = time.monotonic()
+        return next((endpoint for endpoint in candidates if endpoint.ejected_until <= now), candidates[0])
+
+    @contextmanager
+    def acquire(self, model):
+        """
+        Context manager routing one request for `model`.
+
+        Yields:
+            Tuple[Endpoint, OpenAI, str]: The endpoint, its client and the model name to send.
+            An exception leaving the block counts as a failure of the endpoint if it is one of the above.
+        """
+        with self.lock:
+            endpoint = self._choose(model)
+            client = endpoint.get_client()
+            endpoint.in_flight += 1
+            endpoint.stats["requests"] += 1
+        start = time.perf_counter()
+        try:
+            yield endpoint, client, endpoint.model_name(model)
+        except BaseException as e:
+            with self.lock:
+                endpoint.in_flight -= 1
+                endpoint.stats["latency_seconds"] += time.perf_counter() - start
+                if is_endpoint_failure(e):
+                    endpoint.stats["failures"] += 1
+                    endpoint.failures += 1
+                    if endpoint.failures >= self.failure_threshold:
+                        now = time.monotonic()
+                        # Requests sent before the ejection may still fail; they extend it without counting again
+                        endpoint.stats["ejections"] += endpoint.ejected_until <= now
+                        endpoint.ejected_until = now + self.cooldown
+                        # A single failure after the cooldown ejects it again
+                        endpoint.failures = self.failure_threshold - 1
+            raise
+        else:
+            with self.lock:
+                endpoint.in_flight -= 1
+                endpoint.stats["latency_seconds"] += time.perf_counter() - start
+                endpoint.stats["successes"] += 1
+                endpoint.failures = 0
+
+    def stats(self):
+        """Return per-endpoint stats: request, success, failure and ejection counts, in-flight requests, health and mean latency."""
+        with self.lock:
+            now = time.monotonic()
+            return {
+                endpoint.name: {
+                    **endpoint.stats,
+                    "in_flight": endpoint.in_flight,
+                    "healthy": endpoint.ejected_until <= now,
+                    "ejected_for_seconds": max(0.0, endpoint.ejected_until - now),
+                    "mean_latency_seconds": endpoint.stats["latency_seconds"] / endpoint.stats["requests"] if endpoint.stats["requests"] else 0.0,
+                }
+                for endpoint in self.endpoints
+            }
+
+
+def load_pool_config(value):
+    """
+    Build an EndpointPool from a JSON config, given inline or as the path of a JSON file.
+
+    The config is {"strategy": ..., "failure_threshold": ..., "cooldown": ..., "endpoints": [...]}. Each
+    endpoint takes the arguments of `Endpoint`; "api_key_env" names an environment variable holding the key,
+    so keys stay out of the file.
+    """
+    if value.lstrip().startswith("{"):
+        config = json.loads(value)
+    else:
+        with open(value) as f:
+            config = json.load(f)
+    endpoints = []
+    for i, entry in enumerate(config["endpoints"]):
+        entry = dict(entry)
+        if "api_key_env" in entry:
+            entry["api_key"] = os.environ.get(entry.pop("api_key_env"))
+        entry.setdefault("name", f"endpoint_{i}")
+        endpoints.append(Endpoint(**entry))
+    return EndpointPool(
+        endpoints,
+        strategy=config.get("strategy", "least_loaded"),
+        failure_threshold=config.get("failure_threshold", 3),
+        cooldown=config.get("cooldown", 30.0),
+    )
+
+
+def pool_from_env():
+    """
+    Build the endpoint pool described by `LLM_ENDPOINTS` (inline JSON or a file path, see `load_pool_config`).
+
+    Without it, the pool has a single endpoint from `YOUR_OPENAI_API_KEY` and `YOUR_OPENAI_API_BASE_URL`
+    serving every model, as before.
+    """
+    value = os.environ.get("LLM_ENDPOINTS")
+    if value:
+        return load_pool_config(value)
+    return EndpointPool([
+        Endpoint("default", base_url=os.environ.get("YOUR_OPENAI_API_BASE_URL"), api_key=os.environ.get("YOUR_OPENAI_API_KEY")),
+    ])
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    pool = pool_from_env()
+    if len(sys.argv) > 1 and sys.argv[1] != "show":
+        sys.exit(f"Unknown command: {sys.argv[1]}")
+    print(json.dumps({
+        "strategy": pool.strategy,
+        "failure_threshold": pool.failure_threshold,
+        "cooldown": pool.cooldown,
+        "endpoints": [
+            {
+                "name": endpoint.name,
+                "base_url": endpoint.base_url,
+                "api_key": "set" if endpoint.api_key else None,
+                "models": endpoint.models,
+                "weight": endpoint.weight,
+            }
+            for endpoint in pool.endpoints
+        ],
+    }, indent=4))
@@ -0,0 +1,269 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Status codes that may succeed when the same request is sent again
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    A request larger than the bucket capacity is allowed once the bucket is full, so a single
+    oversized prompt never blocks forever.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0):
+        """
+        Block until `amount` tokens are available, then consume them.
+
+        Args:
+            amount (float): Number of tokens to consume.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Empty the bucket, e.g. after the provider reports the quota is exhausted."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = 0.0
+
+
+class AIMDConcurrency:
+    """
+    Concurrency limit adjusted with additive increase and multiplicative decrease.
+
+    Each success raises the limit by `increase / limit`, i.e. by roughly `increase` per full
+    window of requests. A throttle multiplies the limit by `decrease`, at most once per `cooldown`
+    seconds so that a burst of 429s from requests already in flight counts as a single signal.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=1, increase=1.0, decrease=0.5, cooldown=5.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial if initial is not None else maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_decrease = float("-inf")
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + self.increase / max(self.limit, 1.0))
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class RateLimiter:
+    """
+    Shared rate limiter for one model at one endpoint: requests per minute, tokens per minute and adaptive concurrency.
+
+    All workers sending requests for the same model to the same endpoint should share one instance
+    (see `get_rate_limiter`), so that a 429 seen by one worker slows down every other worker as well.
+    """
+
+    def __init__(self, rpm=None, tpm=None, max_concurrency=64):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.concurrency = AIMDConcurrency(max_concurrency)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "wait_seconds": 0.0}
+
+    def _wait_pause(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    @contextmanager
+    def request(self, tokens=0):
+        """
+        Context manager wrapping one API call of roughly `tokens` prompt tokens.
+
+        Blocks until a concurrency slot, enough request/token budget and a global slot
+        (see `set_global_concurrency`) are available.
+        """
+        start = time.monotonic()
+        self.concurrency.acquire()
+        global_slots = None
+        try:
+            self._wait_pause()
+            if self.request_bucket is not None:
+                self.request_bucket.acquire(1)
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(tokens)
+            # Take a global slot last, so a throttled model never holds budget other models could use
+            global_slots = _global_slots
+            if global_slots is not None:
+                global_slots.acquire()
+            with self.lock:
+                self.stats["requests"] += 1
+                self.stats["wait_seconds"] += time.monotonic() - start
+            yield
+        finally:
+            if global_slots is not None:
+                global_slots.release()
+            self.concurrency.release()
+
+    def record_success(self):
+        self.concurrency.on_success()
+
+    def record_throttle(self, retry_after=None):
+        """
+        Register a 429 from the provider.
+
+        Args:
+            retry_after (float, optional): Seconds the provider asked us to wait, if any.
+        """
+        with self.lock:
+            self.stats["throttled"] += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.concurrency.on_throttle()
+        if self.request_bucket is not None:
+            self.request_bucket.drain()
+
+
+_rate_limiters = {}
+_rate_limit_config = {}
+_registry_lock = threading.Lock()
+_global_slots = None
+
+
+def set_global_concurrency(max_concurrency):
+    """
+    Cap the number of API requests in flight across all models in this process.
+
+    Args:
+        max_concurrency (int or None): Global budget; None removes the cap.
+    """
+    global _global_slots
+    _global_slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+
+def configure_rate_limit(model, rpm=None, tpm=None, max_concurrency=64):
+    """
+    Set the quota used for `model`, at each endpoint serving it. Must be called before the first request to take effect.
+
+    Args:
+        model (str): Model name, or "*" for the default applied to every unconfigured model.
+        rpm (int, optional): Requests per minute. None disables the limit.
+        tpm (int, optional): Prompt tokens per minute. None disables the limit.
+        max_concurrency (int, optional): Upper bound for the adaptive concurrency limit.
+    """
+    with _registry_lock:
+        _rate_limit_config[model] = dict(rpm=rpm, tpm=tpm, max_concurrency=max_concurrency)
+        for key in [key for key in _rate_limiters if model in ("*", key[1])]:
+            del _rate_limiters[key]
+
+
+def get_rate_limiter(model, endpoint=None):
+    """
+    Return the process-wide `RateLimiter` shared by all requests for `model` sent to `endpoint`.
+
+    Quotas belong to each endpoint's account, so every (endpoint, model) pair gets its own limiter,
+    configured with the quota of `model` (see `configure_rate_limit`).
+    """
+    key = (endpoint, model)
+    with _registry_lock:
+        if key not in _rate_limiters:
+            config = _rate_limit_config.get(model, _rate_limit_config.get("*", {}))
+            _rate_limiters[key] = RateLimiter(**config)
+        return _rate_limiters[key]
+
+
+def estimate_tokens(input_dict):
+    """
+    Estimate the prompt size of a request in tokens.
+
+    Uses the dataset's `token_length` when the input carries it, otherwise about four characters per token.
+    """
+    token_length = input_dict.get("token_length")
+    if token_length:
+        return int(token_length)
+    return (len(input_dict["system_prompt"]) + len(input_dict["user_message"])) // 4
+
+
+def is_retryable(exception):
+    """Return True for errors that may succeed when the request is retried."""
+    import openai
+
+    if isinstance(exception, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exception, openai.APIStatusError):
+        return exception.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def get_retry_after(exception):
+    """
+    Read the delay requested by the provider from `Retry-After` / `Retry-After-Ms` headers.
+
+    Returns:
+        float or None: Delay in seconds, or None if the response carries no usable header.
+    """
+    response = getattr(exception, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date form of Retry-After is not worth parsing; fall back to exponential backoff
+        return None
+    return None
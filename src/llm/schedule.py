@@ -0,0 +1,71 @@
+import bisect
+import threading
+from collections import deque
+
+
+# Token counts splitting requests into size buckets: < 64K, 64K to 128K, >= 128K
+DEFAULT_BUCKET_BOUNDS = (64000, 128000)
+
+
+class TokenScheduler:
+    """
+    Hands out request indices by estimated token cost, with a concurrency cap per size bucket.
+
+    Requests are split into buckets by `bounds`. With `longest_first`, the largest pending request whose
+    bucket is under its cap is dispatched next, so the biggest prompts start early instead of dragging
+    out the end of a run; otherwise requests keep their input order within the caps. Ties keep input order.
+
+    Args:
+        costs (List[int]): Estimated prompt tokens of each request.
+        bounds (Tuple[int]): Ascending token counts separating the buckets.
+        caps (List[int], optional): Maximum requests in flight per bucket, smallest bucket first.
+            Missing or None entries are uncapped. Defaults to no caps.
+        longest_first (bool, optional): Dispatch the largest requests first. Defaults to True.
+    """
+
+    def __init__(self, costs, bounds=DEFAULT_BUCKET_BOUNDS, caps=None, longest_first=True):
+        self.bounds = tuple(bounds)
+        self.longest_first = longest_first
+        n_buckets = len(self.bounds) + 1
+        caps = list(caps or [])
+        if len(caps) > n_buckets:
+            raise ValueError(f"Got {len(caps)} bucket caps for {n_buckets} buckets.")
+        if any(cap is not None and cap < 1 for cap in caps):
+            raise ValueError("Bucket caps must be at least 1.")
+        self.caps = caps + [None] * (n_buckets - len(caps))
+        self.buckets = [bisect.bisect_right(self.bounds, cost) for cost in costs]
+
+        order = range(len(costs))
+        if longest_first:
+            order = sorted(order, key=lambda idx: -costs[idx])
+        self.queues = [deque() for _ in range(n_buckets)]
+        for idx in order:
+            self.queues[self.buckets[idx]].append(idx)
+        self.in_flight = [0] * n_buckets
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of requests not dispatched yet."""
+        return sum(len(queue) for queue in self.queues)
+
+    def next(self):
+        """
+        Return the index of the next request to dispatch, or None if every pending request's bucket is at its cap
+        (or nothing is pending).
+        """
+        with self._lock:
+            candidates = [
+                bucket for bucket, queue in enumerate(self.queues)
+                if queue and (self.caps[bucket] is None or self.in_flight[bucket] < self.caps[bucket])
+            ]
+            if not candidates:
+                return None
+            # Higher buckets hold larger requests; in input order, take the bucket with the earliest request
+            pick = max(candidates) if self.longest_first else min(candidates, key=lambda bucket: self.queues[bucket][0])
+            self.in_flight[pick] += 1
+            return self.queues[pick].popleft()
+
+    def done(self, idx):
+        """Release the bucket slot of a finished request."""
+        with self._lock:
+            self.in_flight[self.buckets[idx]] -= 1
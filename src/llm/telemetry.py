@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+
+
+class Telemetry:
+    """
+    Collects one record per generation request and keeps rolling per-model aggregates.
+
+    A record holds the model, cache hit or miss, time spent waiting for the rate limiter, time spent
+    in API calls, total latency, prompt and completion tokens, and the cause of every retry. It also
+    holds the endpoint that served it, the finish reason and, for streamed requests, the time to first
+    token and the generation time. Records are appended to `path` (JSONL) when given. Aggregates are
+    written to `summary_path` (JSON) and `prometheus_path` (Prometheus text-file format) every
+    `export_interval` seconds and on `close`. When `path` already holds records, e.g. from an interrupted
+    run being resumed, the aggregates start from them, so the exports always describe the whole file.
+
+    Args:
+        path (str, optional): JSONL file receiving every record.
+        summary_path (str, optional): JSON file receiving the aggregates.
+        prometheus_path (str, optional): Prometheus text file receiving the aggregates.
+        export_interval (float): Minimum seconds between two exports of the aggregates.
+        window (int): Number of recent requests per model used for latency and time-to-first-token quantiles.
+    """
+
+    def __init__(self, path=None, summary_path=None, prometheus_path=None, export_interval=30.0, window=1000):
+        self.path = path
+        self.summary_path = summary_path
+        self.prometheus_path = prometheus_path
+        self.export_interval = export_interval
+        self.window = window
+        self.lock = threading.Lock()
+        self.export_lock = threading.Lock()
+        self.models = {}
+        self.last_export = time.monotonic()
+        self.file = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._load(path)
+            self.file = open(path, "a", encoding="utf-8")
+
+    def _load(self, path):
+        """Aggregate the records already in `path`, dropping a torn last line so appends stay valid JSONL."""
+        if not os.path.exists(path):
+            return
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._add(json.loads(line))
+                valid_bytes += len(line)
+        if valid_bytes != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    @classmethod
+    def for_run_dir(cls, run_dir, **kwargs):
+        """Telemetry stored next to the results of a run: telemetry.jsonl, telemetry.json and telemetry.prom."""
+        return cls(
+            path=os.path.join(run_dir, "telemetry.jsonl"),
+            summary_path=os.path.join(run_dir, "telemetry.json"),
+            prometheus_path=os.path.join(run_dir, "telemetry.prom"),
+            **kwargs,
+        )
+
+    def _model_stats(self, model):
+        stats = self.models.get(model)
+        if stats is None:
+            stats = self.models[model] = {
+                "requests": 0,
+                "cache_hits": 0,
+                "errors": 0,
+                "retries": Counter(),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "queue_wait_seconds": 0.0,
+                "api_seconds": 0.0,
+                "latency_seconds": 0.0,
+                "finish_reasons": Counter(),
+                "endpoints": Counter(),
+                "recent_latencies": deque(maxlen=self.window),
+                "recent_ttfts": deque(maxlen=self.window),
+            }
+        return stats
+
+    def _add(self, record):
+        """Add one record to the aggregates; the caller holds `lock` (or is the constructor)."""
+        stats = self._model_stats(record["model"])
+        stats["requests"] += 1
+        stats["cache_hits"] += record["cache"] == "hit"
+        stats["errors"] += record["error"] is not None
+        stats["retries"].update(record["retry_causes"])
+        stats["prompt_tokens"] += record["prompt_tokens"] or 0
+        stats["completion_tokens"] += record["completion_tokens"] or 0
+        stats["queue_wait_seconds"] += record["queue_wait"]
+        stats["api_seconds"] += record["api_latency"]
+        stats["latency_seconds"] += record["latency"]
+        # Records written before endpoints and streaming were tracked lack the fields below
+        if record.get("endpoint") is not None:
+            stats["endpoints"][record["endpoint"]] += 1
+        if record.get("finish_reason") is not None:
+            stats["finish_reasons"][record["finish_reason"]] += 1
+        if record["cache"] == "miss":
+            stats["recent_latencies"].append(record["latency"])
+        if record.get("ttft") is not None:
+            stats["recent_ttfts"].append(record["ttft"])
+
+    def record(self, record):
+        """Add one finished request record (see `track`)."""
+        with self.lock:
+            self._add(record)
+            if self.file is not None:
+                self.file.write(json.dumps(record) + "\n")
+                self.file.flush()
+            # Checked and claimed in one step, so only one thread runs each periodic export
+            now = time.monotonic()
+            due = now - self.last_export >= self.export_interval
+            if due:
+                self.last_export = now
+        if due:
+            try:
+                self._write_exports()
+            except OSError as e:
+                # A failed periodic export must not fail the request being recorded; the next one retries
+                print(f"Telemetry export failed: {e}")
+
+    def aggregates(self):
+        """
+        Return per-model aggregates: request, cache, retry, endpoint, finish reason and token counts, summed times, and
+        quantiles of recent latencies and times to first token.
+        """
+        import numpy as np
+
+        with self.lock:
+            result = {}
+            for model, stats in self.models.items():
+                recent = np.asarray(stats["recent_latencies"], dtype=np.float64)
+                quantiles = np.quantile(recent, [0.5, 0.95, 0.99]).tolist() if len(recent) else [None] * 3
+                ttfts = np.asarray(stats["recent_ttfts"], dtype=np.float64)
+                ttft_quantiles = np.quantile(ttfts, [0.5, 0.95, 0.99]).tolist() if len(ttfts) else [None] * 3
+                misses = stats["requests"] - stats["cache_hits"]
+                result[model] = {
+                    "requests": stats["requests"],
+                    "cache_hits": stats["cache_hits"],
+                    "cache_hit_rate": stats["cache_hits"] / stats["requests"] if stats["requests"] else 0.0,
+                    "errors": stats["errors"],
+                    "retries": sum(stats["retries"].values()),
+                    "retry_causes": dict(stats["retries"]),
+                    "prompt_tokens": stats["prompt_tokens"],
+                    "completion_tokens": stats["completion_tokens"],
+                    "queue_wait_seconds": stats["queue_wait_seconds"],
+                    "api_seconds": stats["api_seconds"],
+                    "latency_seconds": stats["latency_seconds"],
+                    "mean_queue_wait_seconds": stats["queue_wait_seconds"] / misses if misses else 0.0,
+                    "mean_api_seconds": stats["api_seconds"] / misses if misses else 0.0,
+                    "latency_p50_seconds": quantiles[0],
+                    "latency_p95_seconds": quantiles[1],
+                    "latency_p99_seconds": quantiles[2],
+                    "endpoints": dict(stats["endpoints"]),
+                    "finish_reasons": dict(stats["finish_reasons"]),
+                    "ttft_p50_seconds": ttft_quantiles[0],
+                    "ttft_p95_seconds": ttft_quantiles[1],
+                    "ttft_p99_seconds": ttft_quantiles[2],
+                }
+            return result
+
+    def prometheus_text(self):
+        """Render the aggregates in the Prometheus text exposition format."""
+        aggregates = self.aggregates()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP longpibench_llm_{name} {help_text}")
+            lines.append(f"# TYPE longpibench_llm_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"longpibench_llm_{name}{{{label_text}}} {value}")
+
+        models = sorted(aggregates)
+        metric("requests_total", "counter", "Generation requests.", [({"model": m}, aggregates[m]["requests"]) for m in models])
+        metric("cache_hits_total", "counter", "Requests answered from the response cache.", [({"model": m}, aggregates[m]["cache_hits"]) for m in models])
+        metric("errors_total", "counter", "Requests that failed after all retries.", [({"model": m}, aggregates[m]["errors"]) for m in models])
+        metric("retries_total", "counter", "Retried API calls by cause.", [
+            ({"model": m, "cause": cause}, count) for m in models for cause, count in sorted(aggregates[m]["retry_causes"].items())
+        ])
+        metric("prompt_tokens_total", "counter", "Prompt tokens reported by the API.", [({"model": m}, aggregates[m]["prompt_tokens"]) for m in models])
+        metric("completion_tokens_total", "counter", "Completion tokens reported by the API.", [({"model": m}, aggregates[m]["completion_tokens"]) for m in models])
+        metric("queue_wait_seconds_total", "counter", "Seconds spent waiting for the rate limiter.", [({"model": m}, aggregates[m]["queue_wait_seconds"]) for m in models])
+        metric("api_seconds_total", "counter", "Seconds spent in API calls.", [({"model": m}, aggregates[m]["api_seconds"]) for m in models])
+        metric("latency_seconds", "summary", "Latency of recent uncached requests.", [
+            ({"model": m, "quantile": quantile}, aggregates[m][key])
+            for m in models
+            for quantile, key in (("0.5", "latency_p50_seconds"), ("0.95", "latency_p95_seconds"), ("0.99", "latency_p99_seconds"))
+            if aggregates[m][key] is not None
+        ])
+        metric("endpoint_requests_total", "counter", "Uncached requests by endpoint of the client pool.", [
+            ({"model": m, "endpoint": endpoint}, count) for m in models for endpoint, count in sorted(aggregates[m]["endpoints"].items())
+        ])
+        metric("finishes_total", "counter", "Generated responses by finish reason.", [
+            ({"model": m, "reason": reason}, count) for m in models for reason, count in sorted(aggregates[m]["finish_reasons"].items())
+        ])
+        metric("ttft_seconds", "summary", "Time to first token of recent streamed requests.", [
+            ({"model": m, "quantile": quantile}, aggregates[m][key])
+            for m in models
+            for quantile, key in (("0.5", "ttft_p50_seconds"), ("0.95", "ttft_p95_seconds"), ("0.99", "ttft_p99_seconds"))
+            if aggregates[m][key] is not None
+        ])
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Write the aggregates to `summary_path` and `prometheus_path`, atomically."""
+        with self.lock:
+            self.last_export = time.monotonic()
+        self._write_exports()
+
+    def _write_exports(self):
+        # Serialized so an older snapshot never replaces a newer one
+        with self.export_lock:
+            if self.summary_path is not None:
+                _write_atomic(self.summary_path, json.dumps(self.aggregates(), indent=4))
+            if self.prometheus_path is not None:
+                _write_atomic(self.prometheus_path, self.prometheus_text())
+
+    def close(self):
+        """Export the final aggregates and close the records file."""
+        self.export()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def track(self, model, **fields):
+        """
+        Context manager recording one request; the code inside fills the yielded record
+        (directly or through `current_request`), and it is added when the block exits.
+        """
+        record = {
+            "model": model,
+            "time": time.time(),
+            "cache": "miss",
+            "queue_wait": 0.0,
+            "api_latency": 0.0,
+            "latency": 0.0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "retries": 0,
+            "retry_causes": [],
+            "endpoint": None,
+            "finish_reason": None,
+            "ttft": None,
+            "generation_time": None,
+            "error": None,
+            **fields,
+        }
+        previous = getattr(_current, "record", None)
+        _current.record = record
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = _cause(e)
+            raise
+        finally:
+            record["latency"] = time.perf_counter() - start
+            _current.record = previous
+            try:
+                self.record(record)
+            except Exception as e:
+                # Telemetry is best effort: losing a record must not fail the request it describes
+                print(f"Telemetry record failed: {e}")
+
+
+_current = threading.local()
+
+
+def current_request():
+    """Return the record of the request being tracked in this thread, or None."""
+    return getattr(_current, "record", None)
+
+
+def note_retry(exception):
+    """Count a retry of the current request and its cause, e.g. "RateLimitError:429"."""
+    record = current_request()
+    if record is not None:
+        record["retries"] += 1
+        record["retry_causes"].append(_cause(exception))
+
+
+def _cause(exception):
+    status_code = getattr(exception, "status_code", None)
+    name = type(exception).__name__
+    return f"{name}:{status_code}" if status_code is not None else name
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # A unique temporary file per write, in the same directory so os.replace stays atomic
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_default_telemetry = None
+_default_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Return the process-wide in-memory telemetry, used when a caller does not pass its own."""
+    global _default_telemetry
+    with _default_telemetry_lock:
+        if _default_telemetry is None:
+            _default_telemetry = Telemetry()
+        return _default_telemetry
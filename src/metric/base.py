@@ -1,5 +1,43 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Optional
+import os
+import re
+
+
+def end_of_list(text: str) -> Optional[int]:
+    """
+    Stop condition for answers given as a list: the end of the first bracketed list in `text`.
+
+    Returns:
+    Optional[int]: Offset just after the first ']' that follows a '[', or None while no list is closed yet.
+    """
+    start = text.find('[')
+    if start < 0:
+        return None
+    end = text.find(']', start)
+    return None if end < 0 else end + 1
+
+
+_STRING_LIST_START = re.compile(r"\[\s*['\"]")
+_STRING_LIST_END = re.compile(r"['\"]\s*\]")
+
+
+def end_of_string_list(text: str) -> Optional[int]:
+    """
+    Stop condition for answers given as a list of quoted strings, e.g. "['| a | b |', '| c | d |']".
+
+    The list must open with '[' followed by a quote and close with a quote followed by ']', so a bracketed
+    aside before the answer or a ']' inside a string does not end it.
+
+    Returns:
+    Optional[int]: Offset just after the closing ']', or None while no such list is closed yet.
+    """
+    start = _STRING_LIST_START.search(text)
+    if start is None:
+        return None
+    end = _STRING_LIST_END.search(text, start.end())
+    return None if end is None else end.end()
 
 class NLGMetric(ABC):
     """
@@ -7,32 +45,119 @@ class NLGMetric(ABC):
 
     This class defines the interface for all NLG metrics.
     Subclasses should implement the _evaluate_pair method to compute the metric.
+    Metrics that can score many pairs at once more cheaply may also override _evaluate_batch.
+
+    Attributes:
+    instance_kwargs (Dict[str, str]): Extra keyword arguments of _evaluate_pair, mapped to the dataset
+        field that supplies them for each instance, e.g. {'query': 'question'}.
+    default_backend (str): Backend used by evaluate when none is given: 'serial', 'thread' or 'process'.
+    max_workers (int): Default number of workers for the parallel backends; None uses the CPU count.
+    max_tokens (int): Output-token cap of generations for this task when caps are enabled; None for no cap.
+    stop_condition (Callable[[str], Optional[int]]): Given the text generated so far, the offset where the
+        answer is complete, or None to keep generating; the text after it is dropped. None to never stop early.
 
     Methods:
     evaluate(self, llm_responses: List[str], labels: List[List[str]]) -> List[List[float]]:
         Calculate the metric for each generated text and its labels.
 
+    _evaluate_batch(self, llm_responses: List[str], labels: List[List[str]], extra_kwargs: List[Dict]) -> List[float]:
+        Calculate the metric for a chunk of pairs. Defaults to calling _evaluate_pair on each.
+
     _evaluate_pair(self, llm_response: str, labels: List[str]) -> List[float]:
         Calculate the metric for a single pair of generated text and a list of labels.
     """
 
-    def evaluate(self, llm_responses: List[str], labels: List[List[str]], *args, **kwargs) -> List[float]:
+    instance_kwargs: Dict[str, str] = {}
+    default_backend = 'serial'
+    max_workers = None
+    max_tokens = None
+    stop_condition = None
+
+    def kwargs_for(self, instance: Dict) -> Dict:
+        """
+        Build the extra keyword arguments of _evaluate_pair for one dataset instance.
+
+        Parameters:
+        instance (Dict): A dataset record (or its metadata), e.g. with 'question' and 'answers'.
+
+        Returns:
+        Dict: Keyword arguments declared in `instance_kwargs`.
+        """
+        return {name: instance[field] for name, field in self.instance_kwargs.items()}
+
+    def evaluate(
+        self,
+        llm_responses: List[str],
+        labels: List[List[str]],
+        *args,
+        extra_kwargs: Optional[List[Dict]] = None,
+        backend: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        **kwargs,
+    ) -> List[float]:
         """
         Calculate the metric for each generated text and its labels.
 
+        Pairs are split into chunks that are scored by _evaluate_batch, either in this process
+        or on a thread or process pool. Results keep the input order.
+
         Parameters:
         llm_responses (List[str]): A list of generated texts.
         labels (List[List[str]]): A list of lists, where each sublist contains reference texts for each generated text.
+        extra_kwargs (List[Dict], optional): Per-instance keyword arguments for _evaluate_pair, e.g. from kwargs_for.
+        backend (str, optional): 'serial', 'thread' or 'process'. Defaults to `default_backend`.
+        max_workers (int, optional): Number of workers for the parallel backends.
+        chunksize (int, optional): Pairs per chunk. Defaults to about four chunks per worker.
 
         Returns:
         List[List[float]]: A list of lists of calculated metric values between 0.0 and 1.0.
         """
-        results = []
-        for response, label_list in zip(llm_responses, labels):
-            scores = self._evaluate_pair(response, label_list, *args, **kwargs)
-            results.append(scores)
+        if extra_kwargs is None:
+            extra_kwargs = [{}] * len(llm_responses)
+        backend = backend or self.default_backend
+        if backend == 'serial' or len(llm_responses) <= 1:
+            return self._evaluate_batch(llm_responses, labels, extra_kwargs, *args, **kwargs)
+
+        if backend not in ('thread', 'process'):
+            raise ValueError(f"Unknown backend: {backend}")
+        max_workers = max_workers or self.max_workers or os.cpu_count() or 1
+        chunksize = chunksize or max(1, -(-len(llm_responses) // (max_workers * 4)))
+        executor_cls = ThreadPoolExecutor if backend == 'thread' else ProcessPoolExecutor
+        with executor_cls(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._evaluate_batch,
+                    llm_responses[start:start + chunksize],
+                    labels[start:start + chunksize],
+                    extra_kwargs[start:start + chunksize],
+                    *args,
+                    **kwargs,
+                )
+                for start in range(0, len(llm_responses), chunksize)
+            ]
+            results = []
+            for future in futures:
+                results.extend(future.result())
         return results
 
+    def _evaluate_batch(self, llm_responses: List[str], labels: List[List[str]], extra_kwargs: List[Dict], *args, **kwargs) -> List[float]:
+        """
+        Calculate the metric for a chunk of pairs. Override for metrics that can score a whole batch at once.
+
+        Parameters:
+        llm_responses (List[str]): A list of generated texts.
+        labels (List[List[str]]): Reference texts for each generated text.
+        extra_kwargs (List[Dict]): Per-instance keyword arguments for _evaluate_pair.
+
+        Returns:
+        List[float]: One metric value per pair.
+        """
+        return [
+            self._evaluate_pair(response, label_list, *args, **instance_kwargs, **kwargs)
+            for response, label_list, instance_kwargs in zip(llm_responses, labels, extra_kwargs)
+        ]
+
     @abstractmethod
     def _evaluate_pair(self, llm_response: str, labels: List[str], *args, **kwargs) -> float:
         """
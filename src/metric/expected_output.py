@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .sandbox import SandboxPool, TIMEOUT_MARKER, EXIT_MARKER
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expected_outputs (
+    key TEXT PRIMARY KEY,
+    stdout TEXT NOT NULL,
+    stderr TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+# Bumped when stored outputs may be wrong; version 2 no longer stores failed runs, which version 1 did
+STORE_VERSION = "2"
+
+
+def source_key(source):
+    """
+    Key of a ground-truth program: hash of its source, of the interpreter version running it and of the store version.
+    """
+    digest = hashlib.sha256()
+    digest.update(STORE_VERSION.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(sys.version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExpectedOutputStore:
+    """
+    Persistent SQLite store of ground-truth program outputs for code completion scoring.
+
+    Ground-truth programs are deterministic, so each one only needs to run once per interpreter;
+    every later evaluation of the same instance reads the stored stdout instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def __getstate__(self):
+        # Connections cannot be pickled; worker processes open their own
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, source):
+        """Return the stored (stdout, stderr) of `source`, or None if it has not been run yet."""
+        row = self._connection().execute(
+            "SELECT stdout, stderr FROM expected_outputs WHERE key = ?", (source_key(source),)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def put(self, source, stdout, stderr):
+        """
+        Store the output of `source`. Runs that timed out, exited non-zero or ran out of memory are not stored,
+        so they are retried next time instead of becoming the expected output.
+        """
+        if TIMEOUT_MARKER in stderr or EXIT_MARKER in stderr or "MemoryError" in stderr:
+            return
+        self._connection().execute(
+            "INSERT OR REPLACE INTO expected_outputs (key, stdout, stderr, created) VALUES (?, ?, ?, ?)",
+            (source_key(source), stdout, stderr, time.time()),
+        )
+
+    def get_or_run(self, source, run):
+        """
+        Return the output of `source`, calling `run(source)` and storing the result on a miss.
+
+        Parameters:
+            source (str): Ground-truth program.
+            run (Callable[[str], Tuple[str, str]]): Executes a program and returns (stdout, stderr).
+        """
+        output = self.get(source)
+        if output is None:
+            output = run(source)
+            self.put(source, *output)
+        return output
+
+    def precompute(self, sources, pool=None):
+        """
+        Run every distinct program in `sources` that is not stored yet, in parallel.
+
+        Returns:
+            int: Number of programs executed.
+        """
+        pool = pool or SandboxPool()
+        missing = [source for source in dict.fromkeys(sources) if self.get(source) is None]
+        for source, output in zip(missing, pool.run_many(missing)):
+            self.put(source, *output)
+        return len(missing)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_expected_output_store():
+    """
+    Return the process-wide store, located at `EXPECTED_OUTPUT_CACHE_PATH` (default `.cache/expected_outputs.sqlite`).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ExpectedOutputStore(
+                os.environ.get("EXPECTED_OUTPUT_CACHE_PATH", os.path.join(".cache", "expected_outputs.sqlite"))
+            )
+        return _default_store
+
+
+if __name__ == "__main__":
+    # Usage: python -m src.metric.expected_output data/code_completion_absolute.json [more task files ...]
+    from src.dataset.loader import IndexedDataset
+
+    sources = []
+    for path in sys.argv[1:]:
+        with IndexedDataset(path) as dataset:
+            sources.extend(record["answers"][0] for record in dataset.iter_records())
+    executed = get_expected_output_store().precompute(sources)
+    print(f"{len(set(sources))} ground-truth programs, {executed} executed.")
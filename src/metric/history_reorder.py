@@ -1,9 +1,9 @@
 import re
-from .base import NLGMetric
-from typing import List
-
-from scipy.stats import spearmanr
-from scipy.stats import kendalltau
+import ast
+from functools import lru_cache
+from .base import NLGMetric, end_of_list
+from .matcher import trie_regex
+from typing import List, Dict
 
 def sequence_similarity_spearman(gt_list, pred_list):
     # 首先确保两个列表的元素集相同，如果不同可能需要根据任务需求处理
@@ -20,11 +20,17 @@ def sequence_similarity_spearman(gt_list, pred_list):
     pos_pred = list(range(len(pred_list)))  
     
     # 计算Spearman相关系数
-    correlation, _ = spearmanr(pos_gt, pos_pred)
-    return correlation
+    # Imported here: numpy is slow to import and only needed here
+    from .rank_correlation import spearman_batch
 
+    return spearman_batch([pos_gt], [pos_pred])[0]
 
-def parse_and_sort_events(llm_response, query):
+
+@lru_cache(maxsize=4096)
+def parse_query_events(query):
+    """
+    Parse a query of the form "0: event; 1: event; ..." into ((idx, event_string), ...), cached per query.
+    """
     # 解析 query，将其转换为 {idx: stripped_string} 的形式
     events = {}
     for line in query.split(';'):
@@ -33,12 +39,46 @@ def parse_and_sort_events(llm_response, query):
         idx, content = line.split(':', 1)
         idx = int(idx.strip())
         events[idx] = content.strip()
+    return tuple(events.items())
+
+
+class EventLocator:
+    """
+    Finds the first position of every event string of a query in a response, in one pass.
+
+    A lookahead over a trie regex reports the longest event string starting at each position; every
+    event that is a prefix of it starts there too. Positions are identical to `llm_response.find(event)`.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        strings = list(dict.fromkeys(content for _, content in events if content))
+        # For each event string, the event strings that are prefixes of it (itself included)
+        self.prefixes = {string: [other for other in strings if string.startswith(other)] for string in strings}
+        self.pattern = re.compile('(?=(' + trie_regex(strings) + '))') if strings else None
+        self.count = len(strings)
+
+    def positions(self, llm_response):
+        """Return [(position, idx), ...] in query order, with -1 for events not found."""
+        first = {'': 0}
+        if self.pattern is not None:
+            for match in self.pattern.finditer(llm_response):
+                for string in self.prefixes[match.group(1)]:
+                    first.setdefault(string, match.start())
+                if len(first) > self.count:
+                    break
+        return [(first.get(content, -1), idx) for idx, content in self.events]
+
+
+@lru_cache(maxsize=4096)
+def get_event_locator(query):
+    """Return the cached EventLocator of a query."""
+    return EventLocator(parse_query_events(query))
 
+
+def parse_and_sort_events(llm_response, query):
     # 检索每个字符串在 llm_response 中的位置
-    positions = []
-    for idx, event_string in events.items():
-        position = llm_response.find(event_string)
-        positions.append((position, idx))
+    positions = get_event_locator(query).positions(llm_response)
 
     # 根据位置排序，从前到后
     sorted_positions = sorted(positions)
@@ -69,39 +109,20 @@ def remove_letters_and_strip(input_str: str) -> str:
     
     return cleaned_str
 
-from scipy.stats import spearmanr
-
-def sequence_similarity_spearman(gt_list, pred_list):
-    # 首先确保两个列表的元素集相同，如果不同可能需要根据任务需求处理
-    # 假设元素集合相同且都是独特元素：
-    # 为每个元素在真实序列中找到其排名（索引）
-    pos_map_gt = {elem: i for i, elem in enumerate(gt_list)}
-    pos_gt = []
-    pos_pred = []
-    
-    for elem in pred_list:
-        # 将预测序列中的元素位置映射到真实序列中的排名
-        pos_gt.append(pos_map_gt[elem])
-    # 预测序列本身的索引即为预测排名
-    pos_pred = list(range(len(pred_list)))  
-    
-    # 计算Spearman相关系数
-    correlation, _ = spearmanr(pos_gt, pos_pred)
-    return correlation
-
 
 class HistoryReorderMetric(NLGMetric):
+    instance_kwargs = {'query': 'question'}
+    # Only the first bracketed list is scored (see predicted_order), so generation can stop once it is closed
+    max_tokens = 1024
+    stop_condition = staticmethod(end_of_list)
 
-    def _evaluate_pair(self, llm_response: str, labels: List[str], query: str) -> float:
+    def predicted_order(self, llm_response: str, query: str) -> List[str]:
         """
-        Calculate the History Reorder metric for a single pair of generated text and a list of labels.
+        Extract the event order given by the response, as a list of event indices.
 
-        Args:
-            llm_response (str): The generated text to evaluate.
-            labels (List[str]): A list of reference texts. In this task, the list contains a single string with a comma-separated list of indices of the events in the correct order.
-
-        Returns:
-            float: The History Reorder metric value between 0.0 and 1.0, representing the proportion of correctly ordered events.
+        Events are ordered by where they first appear in the bracketed part of the response (or the whole
+        response if it has no brackets). When that yields the identity order, the bracketed part is also
+        tried as a literal list of indices, e.g. "[3, 0, 5, ...]".
         """
         prefix = llm_response.find('[')
         suffix = llm_response.find(']')
@@ -109,36 +130,45 @@ class HistoryReorderMetric(NLGMetric):
         if not cut_llm_response:
             cut_llm_response = llm_response
 
-        ground_truth_order_list = labels[0].split(", ")
-        
         llm_response_order_list = parse_and_sort_events(cut_llm_response, query)
         if llm_response_order_list == ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']:
             # try this
             try:
-                raw_llm_response_order_list = eval(cut_llm_response)
+                raw_llm_response_order_list = ast.literal_eval(cut_llm_response)
                 llm_response_order_list = [str(i) for i in raw_llm_response_order_list]
-            except:
+            except Exception:
                 pass
+        return llm_response_order_list
 
-        # remove all the elem in llm that is not in gt
-        try:
-            tau1, _ = kendalltau(ground_truth_order_list, llm_response_order_list)
-            return tau1
-        except:
-            return 0.0
-        
-        
-        # if len(ground_truth_order_list) != len(llm_response_order_list):
-        #     # If the number of events in the ground truth and the generated response are different, return 0.0
-        #     return 0.0
-
-        # num_events_to_reorder = len(ground_truth_order_list)
-        # num_correct_indices = 0
-        # for i in range(num_events_to_reorder):
-        #     if ground_truth_order_list[i] == llm_response_order_list[i]:
-        #         num_correct_indices += 1
-        # breakpoint()
-        # return float(num_correct_indices / num_events_to_reorder)
+    def _evaluate_pair(self, llm_response: str, labels: List[str], query: str) -> float:
+        """
+        Calculate the History Reorder metric for a single pair of generated text and a list of labels.
+
+        Args:
+            llm_response (str): The generated text to evaluate.
+            labels (List[str]): A list of reference texts. In this task, the list contains a single string with a comma-separated list of indices of the events in the correct order.
+
+        Returns:
+            float: Kendall's tau between the ground-truth order and the order given by the response.
+        """
+        return self._evaluate_batch([llm_response], [labels], [{'query': query}])[0]
+
+    def _evaluate_batch(self, llm_responses: List[str], labels: List[List[str]], extra_kwargs: List[Dict], *args, **kwargs) -> List[float]:
+        """
+        Calculate the History Reorder metric for a batch of pairs, with Kendall's tau computed for all of them at once.
+
+        Orders of different lengths score 0.0.
+        """
+        # Imported here: the batched tau needs numpy, which importing the metric does not
+        from .rank_correlation import kendall_tau_batch
+
+        ground_truth_order_lists = [label_list[0].split(", ") for label_list in labels]
+        llm_response_order_lists = [
+            self.predicted_order(llm_response, instance_kwargs['query'])
+            for llm_response, instance_kwargs in zip(llm_responses, extra_kwargs)
+        ]
+        taus = kendall_tau_batch(ground_truth_order_lists, llm_response_order_lists)
+        return [0.0 if tau is None else tau for tau in taus]
 
 
 if __name__ == "__main__":
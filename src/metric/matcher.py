@@ -0,0 +1,37 @@
+import re
+from typing import Sequence
+
+
+def trie_regex(words) -> str:
+    """
+    Build a regex matching any of `words`, factored as a prefix trie.
+
+    Children are tried before ending at a terminal node, so at each position the longest word wins,
+    and matching costs O(match length) instead of one attempt per word.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+def recall(text: str, labels: Sequence[str]) -> float:
+    """
+    Fraction of `labels` contained in `text`.
+
+    Each label is looked up with `str.__contains__`, mapped over the labels so the loop runs in C.
+    For the ten or so labels of an instance this is faster than a single-pass matcher, whether
+    that is a lookahead trie regex or an automaton written in Python.
+    """
+    return sum(map(text.__contains__, labels)) / len(labels)
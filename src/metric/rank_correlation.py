@@ -0,0 +1,108 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def _dense_codes(sequences: Sequence[Sequence], n: int) -> np.ndarray:
+    """
+    Encode each sequence as integer codes that preserve the order and ties of its own values.
+    """
+    codes = np.empty((len(sequences), n), dtype=np.int64)
+    for row, sequence in enumerate(sequences):
+        _, codes[row] = np.unique(np.asarray(sequence), return_inverse=True)
+    return codes
+
+
+def _pair_signs(codes: np.ndarray) -> np.ndarray:
+    """Return sign(v_i - v_j) for all pairs i < j, shape (batch, n * (n - 1) / 2)."""
+    i, j = np.triu_indices(codes.shape[1], k=1)
+    return np.sign(codes[:, i] - codes[:, j])
+
+
+def kendall_tau_batch(xs: Sequence[Sequence], ys: Sequence[Sequence]) -> List[float]:
+    """
+    Kendall's tau-b of many pairs of sequences, computed with NumPy array operations.
+
+    Values may be any comparable type (strings compare lexicographically, as in `scipy.stats.kendalltau`),
+    and the result matches scipy's tau-b: NaN for empty or constant sequences. Pairs of sequences with
+    different lengths raise ValueError in scipy; here they are reported as None.
+
+    Parameters:
+        xs (Sequence[Sequence]): First sequence of each pair.
+        ys (Sequence[Sequence]): Second sequence of each pair.
+
+    Returns:
+        List[float]: tau-b of each pair, or None where the lengths differ.
+    """
+    taus = [None] * len(xs)
+    groups = {}
+    for row, (x, y) in enumerate(zip(xs, ys)):
+        if len(x) != len(y):
+            continue
+        groups.setdefault(len(x), []).append(row)
+
+    for n, rows in groups.items():
+        if n == 0:
+            for row in rows:
+                taus[row] = float("nan")
+            continue
+        sx = _pair_signs(_dense_codes([xs[row] for row in rows], n))
+        sy = _pair_signs(_dense_codes([ys[row] for row in rows], n))
+        total = n * (n - 1) // 2
+        x_ties = total - np.count_nonzero(sx, axis=1)
+        y_ties = total - np.count_nonzero(sy, axis=1)
+        con_minus_dis = (sx * sy).sum(axis=1)
+        degenerate = (x_ties == total) | (y_ties == total)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tau = con_minus_dis / np.sqrt(total - x_ties) / np.sqrt(total - y_ties)
+        tau = np.minimum(1.0, np.maximum(-1.0, tau))
+        tau[degenerate] = np.nan
+        for row, value in zip(rows, tau.tolist()):
+            taus[row] = value
+    return taus
+
+
+def _average_ranks(codes: np.ndarray) -> np.ndarray:
+    """Rank each row from 1 to n, giving tied values the mean of their ranks."""
+    order = np.argsort(codes, axis=1, kind="mergesort")
+    sorted_codes = np.take_along_axis(codes, order, axis=1)
+    n = codes.shape[1]
+    ranks = np.empty(codes.shape, dtype=np.float64)
+    for row in range(codes.shape[0]):
+        # Boundaries of runs of equal values in the sorted row
+        starts = np.r_[True, sorted_codes[row, 1:] != sorted_codes[row, :-1]]
+        run_ids = np.cumsum(starts) - 1
+        first = np.flatnonzero(starts)
+        last = np.r_[first[1:], n] - 1
+        ranks[row, order[row]] = ((first + last) / 2.0 + 1.0)[run_ids]
+    return ranks
+
+
+def spearman_batch(xs: Sequence[Sequence], ys: Sequence[Sequence]) -> List[float]:
+    """
+    Spearman's rho of many pairs of sequences: Pearson correlation of their average ranks.
+
+    Matches `scipy.stats.spearmanr` on one pair: NaN for constant sequences or fewer than two values.
+    Pairs of sequences with different lengths are reported as None.
+    """
+    rhos = [None] * len(xs)
+    groups = {}
+    for row, (x, y) in enumerate(zip(xs, ys)):
+        if len(x) == len(y):
+            groups.setdefault(len(x), []).append(row)
+
+    for n, rows in groups.items():
+        if n < 2:
+            for row in rows:
+                rhos[row] = float("nan")
+            continue
+        rx = _average_ranks(_dense_codes([xs[row] for row in rows], n))
+        ry = _average_ranks(_dense_codes([ys[row] for row in rows], n))
+        rx -= rx.mean(axis=1, keepdims=True)
+        ry -= ry.mean(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rho = (rx * ry).sum(axis=1) / np.sqrt((rx * rx).sum(axis=1) * (ry * ry).sum(axis=1))
+        rho = np.minimum(1.0, np.maximum(-1.0, rho))
+        for row, value in zip(rows, rho.tolist()):
+            rhos[row] = value
+    return rhos
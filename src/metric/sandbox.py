@@ -0,0 +1,118 @@
+import os
+import sys
+import signal
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows; memory limits are skipped there
+    resource = None
+
+# Appended to stderr when a program is killed for exceeding its time limit
+TIMEOUT_MARKER = "TimeoutExpired: killed after"
+# Appended to stderr when a program exits with a non-zero status
+EXIT_MARKER = "ExitStatus: exited with"
+
+# Native thread pools (OpenBLAS, OpenMP, MKL) reserve address space per thread, which counts against
+# RLIMIT_AS; on many-core hosts numpy-based programs could then fail at import under the memory limit
+_SINGLE_THREAD_ENV = {"OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+
+
+def _command(src_path, memory_limit_mb):
+    """
+    Build the command running `src_path`, with the memory limit applied by the child itself.
+
+    The limits are set by a small launcher before the script starts rather than by a `preexec_fn`,
+    which is unsafe when the parent runs threads (see `SandboxPool`).
+    """
+    if resource is None:
+        return [sys.executable, src_path]
+    # Keep crashing scripts from writing core dumps into the workspace
+    limits = ["resource.setrlimit(resource.RLIMIT_CORE, (0, 0))"]
+    if memory_limit_mb is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        limits.append(f"resource.setrlimit(resource.RLIMIT_AS, ({limit}, {limit}))")
+    launcher = "; ".join([
+        "import resource, runpy, sys",
+        *limits,
+        "sys.argv = sys.argv[1:]",
+        "runpy.run_path(sys.argv[0], run_name='__main__')",
+    ])
+    return [sys.executable, "-c", launcher, src_path]
+
+
+def run_python_source(source, timeout=30, memory_limit_mb=2048):
+    """
+    Execute Python source in a fresh temporary workspace and capture its output.
+
+    The script runs in its own process group with the workspace as working directory, with native
+    thread pools limited to one thread. If it exceeds `timeout` seconds, the whole group is killed and
+    whatever it printed so far is returned, with TIMEOUT_MARKER in stderr; any other non-zero exit adds
+    EXIT_MARKER. The workspace is removed afterwards in every case.
+
+    Parameters:
+        source (str): The program to run.
+        timeout (float): Wall-clock limit in seconds.
+        memory_limit_mb (int, optional): Address-space limit in MiB, None for no limit.
+
+    Returns:
+        tuple: A tuple containing the standard output and standard error.
+    """
+    with tempfile.TemporaryDirectory(prefix="code_completion_") as workspace:
+        src_path = os.path.join(workspace, "src.py")
+        with open(src_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        try:
+            proc = subprocess.Popen(
+                _command(src_path, memory_limit_mb),
+                cwd=workspace,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                start_new_session=True,
+                env={**os.environ, **_SINGLE_THREAD_ENV},
+            )
+        except Exception as e:
+            return str(e), ""
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, AttributeError):
+                proc.kill()
+            stdout, stderr = proc.communicate()
+            stderr += f"\n{TIMEOUT_MARKER} {timeout} seconds"
+        else:
+            if proc.returncode != 0:
+                stderr += f"\n{EXIT_MARKER} status {proc.returncode}"
+        return stdout, stderr
+
+
+class SandboxPool:
+    """
+    Runs many Python programs in parallel, each in its own isolated workspace.
+
+    Threads are enough here: every job spends its time waiting on a child process.
+    """
+
+    def __init__(self, max_workers=None, timeout=30, memory_limit_mb=2048):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+
+    def run(self, source):
+        """Run one program, returning (stdout, stderr)."""
+        return run_python_source(source, timeout=self.timeout, memory_limit_mb=self.memory_limit_mb)
+
+    def map(self, func, *iterables):
+        """Apply `func` in parallel over the iterables, preserving order."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, *iterables))
+
+    def run_many(self, sources):
+        """Run all programs in parallel, returning their (stdout, stderr) in input order."""
+        return self.map(self.run, sources)
@@ -1,5 +1,6 @@
 import ast
-from .base import NLGMetric
+from .base import NLGMetric, end_of_string_list
+from .matcher import recall
 from typing import List
 
 class SQLMetric(NLGMetric):
@@ -7,7 +8,10 @@ class SQLMetric(NLGMetric):
     RetrievalMetric class for evaluating the correctness of code-generated responses.
 
     This class parses the predicted value from the generated response and compares it with the label.
+    Answers are a python list of quoted rows, so generation can stop once that list is closed.
     """
+    max_tokens = 1024
+    stop_condition = staticmethod(end_of_string_list)
 
     def _evaluate_pair(self, llm_response: str, label: List[str]) -> float:
         """
@@ -20,13 +24,7 @@ class SQLMetric(NLGMetric):
         Returns:
         float: The calculated metric value between 0.0 and 1.0.
         """
-        label_recall_num = 0
-        for single_label in label:
-            if single_label in llm_response:
-                label_recall_num += 1
-        
-        total_score = label_recall_num / len(label)
-        return total_score
+        return recall(llm_response, label)
 
 
 if __name__ == "__main__":
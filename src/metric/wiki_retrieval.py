@@ -1,20 +1,13 @@
 from .base import NLGMetric
+from .matcher import recall
 from typing import List
 
 
 class WikiQAMetric(NLGMetric):
-    
+
     def _evaluate_pair(self, llm_response: str, labels: List[str]) -> float:
         """get the recall rate, check if the llm_response contains any of the labels"""
-        recall_total = len(labels)
-        recall_count = 0
-        
-        llm_response = llm_response.lower()
-        labels = [label.lower() for label in labels]
-        for label in labels:
-            if label in llm_response:
-                recall_count += 1
-        return recall_count / recall_total
+        return recall(llm_response.lower(), [label.lower() for label in labels])
 
 if __name__ == "__main__":
     # Test the WikiQAMetric with provided cases
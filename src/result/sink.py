@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+
+
+# Fields identifying one scored instance within a run
+RESULT_KEY_FIELDS = ("seed_id", "level", "type", "token_level", "random_seed")
+
+
+def result_key(result):
+    """Return the tuple identifying a result record (or an instance plus its 'random_seed')."""
+    return tuple(result[field] for field in RESULT_KEY_FIELDS)
+
+
+def load_results(path):
+    """
+    Read all complete records of a JSONL results file, ignoring a partially written last line.
+
+    Returns:
+        List[Dict]: The result records in file order.
+    """
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            results.append(json.loads(line))
+    return results
+
+
+class ResultSink:
+    """
+    Append-only JSONL writer for scored instances that survives crashes.
+
+    Every record is written as one line and flushed immediately (and fsynced if `fsync` is set), so a
+    crash loses at most the instance being written. When the file already exists, its complete records
+    are loaded into `done` so that a restarted run can skip them, and a torn last line is truncated.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.done = set()
+        valid_bytes = 0
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self.done.add(result_key(json.loads(line)))
+                    valid_bytes += len(line)
+            if valid_bytes != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(valid_bytes)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def write(self, result):
+        """Append one result record and flush it to disk."""
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.done.add(result_key(result))
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RunManifest:
+    """
+    Completion manifest of a run directory, stored as `manifest.json`.
+
+    Each finished results file is recorded with its expected and written counts, so a restarted
+    run can skip it without reading it.
+    """
+
+    def __init__(self, run_dir):
+        self.path = os.path.join(run_dir, "manifest.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def is_complete(self, name, expected=None):
+        entry = self.entries.get(name)
+        if entry is None or not entry.get("complete"):
+            return False
+        return expected is None or entry.get("expected") == expected
+
+    def mark_complete(self, name, **info):
+        """Record `name` as finished; `info` is stored alongside (e.g. expected and written counts)."""
+        with self.lock:
+            self.entries[name] = dict(info, complete=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import csv
+import json
+import argparse
+
+import numpy as np
+
+from .sink import load_results
+
+
+TASKS = ("code_completion", "history_reorder", "table_sql", "wiki_qa")
+
+# res/{task}_{model}_dsd{n}_rsd{m}[_{variant}][/tl{token_level}]/rsd_{seed}_{type}.json(l)
+_RUN_DIR_PATTERN = re.compile(r"^(?P<task>" + "|".join(TASKS) + r")_(?P<model>.+)_dsd\d+_rsd\d+(?:_(?P<variant>.+))?$")
+_TOKEN_LEVEL_DIR_PATTERN = re.compile(r"^tl\d+$")
+_RESULT_FILE_PATTERN = re.compile(r"^rsd_(?P<seed>\d+)_(?P<type>absolute|relative)\.jsonl?$")
+
+STRING_COLUMNS = ("task", "model", "variant", "type", "seed_id")
+NUMERIC_COLUMNS = {"level": np.int16, "token_level": np.int32, "random_seed": np.int32, "score": np.float64}
+COLUMNS = STRING_COLUMNS + tuple(NUMERIC_COLUMNS)
+
+
+def _find_result_files(res_root):
+    """
+    Yield (path, task, model, variant, random_seed) for every results file under `res_root`.
+
+    Results files sit in a run directory (single token level runs) or in its `tl<N>/` subdirectories.
+    """
+    for run_dir in sorted(os.listdir(res_root)):
+        match = _RUN_DIR_PATTERN.match(run_dir)
+        run_path = os.path.join(res_root, run_dir)
+        if match is None or not os.path.isdir(run_path):
+            continue
+        dirpaths = [run_path] + [
+            os.path.join(run_path, name) for name in sorted(os.listdir(run_path))
+            if _TOKEN_LEVEL_DIR_PATTERN.match(name) and os.path.isdir(os.path.join(run_path, name))
+        ]
+        for dirpath in dirpaths:
+            for filename in sorted(os.listdir(dirpath)):
+                file_match = _RESULT_FILE_PATTERN.match(filename)
+                if file_match is not None:
+                    yield (
+                        os.path.join(dirpath, filename),
+                        match.group("task"),
+                        match.group("model"),
+                        match.group("variant") or "default",
+                        int(file_match.group("seed")),
+                    )
+
+
+def _read_results(path):
+    if path.endswith(".jsonl"):
+        return load_results(path)
+    with open(path) as f:
+        return json.load(f)
+
+
+def ingest_results(res_root, store_dir):
+    """
+    Compact all results files under `res_root` into a columnar store at `store_dir`.
+
+    Every column is saved as a `.npy` array; string columns hold integer codes into the dictionaries
+    saved in `dictionaries.json`. Both the pretty-printed JSON and the JSONL results layouts are read.
+
+    Returns:
+        int: Number of ingested result records.
+    """
+    dictionaries = {name: {} for name in STRING_COLUMNS}
+    columns = {name: [] for name in COLUMNS}
+
+    def encode(name, value):
+        return dictionaries[name].setdefault(value, len(dictionaries[name]))
+
+    for path, task, model, variant, random_seed in _find_result_files(res_root):
+        for record in _read_results(path):
+            score = record["metric_result"]
+            columns["task"].append(encode("task", task))
+            columns["model"].append(encode("model", model))
+            columns["variant"].append(encode("variant", variant))
+            columns["type"].append(encode("type", record["type"]))
+            columns["seed_id"].append(encode("seed_id", record["seed_id"]))
+            columns["level"].append(int(str(record["level"]).split()[-1]))
+            columns["token_level"].append(int(record["token_level"]))
+            columns["random_seed"].append(int(record.get("random_seed", random_seed)))
+            columns["score"].append(np.nan if score is None else float(score))
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name in STRING_COLUMNS:
+        np.save(os.path.join(store_dir, f"{name}.npy"), np.asarray(columns[name], dtype=np.int32))
+    for name, dtype in NUMERIC_COLUMNS.items():
+        np.save(os.path.join(store_dir, f"{name}.npy"), np.asarray(columns[name], dtype=dtype))
+    with open(os.path.join(store_dir, "dictionaries.json"), "w") as f:
+        json.dump({name: list(values) for name, values in dictionaries.items()}, f, indent=4)
+    return len(columns["score"])
+
+
+class ResultStore:
+    """
+    Read-only view of a columnar results store written by `ingest_results`.
+
+    Columns are memory-mapped, so opening a store is cheap regardless of its size.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "dictionaries.json")) as f:
+            self.dictionaries = {name: np.asarray(values, dtype=object) for name, values in json.load(f).items()}
+        self.columns = {name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["score"])
+
+    def decode(self, name, codes):
+        """Map codes of a string column back to their values; numeric columns are returned unchanged."""
+        if name in self.dictionaries:
+            return self.dictionaries[name][codes]
+        return codes
+
+    def mask(self, **filters):
+        """Boolean row mask for equality filters on decoded values, e.g. mask(task="table_sql", token_level=32000)."""
+        keep = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            if name in self.dictionaries:
+                codes = np.flatnonzero(self.dictionaries[name] == value)
+                keep &= np.isin(self.columns[name], codes)
+            else:
+                keep &= self.columns[name] == value
+        return keep
+
+
+def _bootstrap_ci(seed_means, n_boot, ci, rng):
+    """
+    Percentile bootstrap CI of the mean across random seeds, for groups that all have the same number of seeds.
+
+    Parameters:
+        seed_means (np.ndarray): (groups, seeds) matrix of per-seed mean scores.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Lower and upper bounds per group.
+    """
+    n_seeds = seed_means.shape[1]
+    samples = rng.integers(0, n_seeds, size=(n_boot, n_seeds))
+    boot_means = seed_means[:, samples].mean(axis=2)  # (groups, n_boot)
+    alpha = (1.0 - ci) / 2.0
+    return np.quantile(boot_means, alpha, axis=1), np.quantile(boot_means, 1.0 - alpha, axis=1)
+
+
+def aggregate(store, by=("task", "model", "variant", "type", "token_level", "level"), n_boot=1000, ci=0.95, seed=0, **filters):
+    """
+    Per-group mean, variance and bootstrap confidence interval of scores across random seeds.
+
+    Scores are first averaged per (group, random seed), ignoring NaN scores; the mean, sample variance and
+    percentile bootstrap CI are then taken over those per-seed means. All steps are vectorized.
+
+    Parameters:
+        store (ResultStore): The results store.
+        by (Tuple[str]): Columns defining a group.
+        n_boot (int): Number of bootstrap resamples.
+        ci (float): Confidence level of the interval.
+        seed (int): Seed of the bootstrap random generator.
+        **filters: Equality filters applied before grouping, see `ResultStore.mask`.
+
+    Returns:
+        List[Dict]: One row per group with the group columns, n_seeds, n_instances, mean, var, ci_low and ci_high.
+    """
+    keep = store.mask(**filters)
+    scores = np.asarray(store.columns["score"])[keep]
+    keys = np.stack([np.asarray(store.columns[name])[keep].astype(np.int64) for name in by], axis=1)
+    seeds = np.asarray(store.columns["random_seed"])[keep]
+    if len(scores) == 0:
+        return []
+
+    # Mean score per (group, random seed), skipping NaN scores
+    group_keys, group_ids = np.unique(keys, axis=0, return_inverse=True)
+    group_ids = group_ids.reshape(-1)
+    seed_values, seed_ids = np.unique(seeds, return_inverse=True)
+    cell = group_ids * len(seed_values) + seed_ids.reshape(-1)
+    valid = ~np.isnan(scores)
+    n_cells = len(group_keys) * len(seed_values)
+    sums = np.bincount(cell[valid], weights=scores[valid], minlength=n_cells)
+    counts = np.bincount(cell[valid], minlength=n_cells)
+    instances = np.bincount(group_ids, minlength=len(group_keys))
+    with np.errstate(invalid="ignore"):
+        seed_means = (sums / counts).reshape(len(group_keys), len(seed_values))
+
+    present = ~np.isnan(seed_means)
+    n_seeds = present.sum(axis=1)
+    mean = np.full(len(group_keys), np.nan)
+    var = np.full(len(group_keys), np.nan)
+    ci_low = np.full(len(group_keys), np.nan)
+    ci_high = np.full(len(group_keys), np.nan)
+    rng = np.random.default_rng(seed)
+    # Groups with the same number of seeds are bootstrapped together
+    for k in np.unique(n_seeds):
+        if k == 0:
+            continue
+        rows = np.flatnonzero(n_seeds == k)
+        compact = seed_means[rows][present[rows]].reshape(len(rows), k)
+        mean[rows] = compact.mean(axis=1)
+        if k > 1:
+            var[rows] = compact.var(axis=1, ddof=1)
+        ci_low[rows], ci_high[rows] = _bootstrap_ci(compact, n_boot, ci, rng)
+
+    table = []
+    for i, key in enumerate(group_keys):
+        row = {name: store.decode(name, value) if name in store.dictionaries else value.item() for name, value in zip(by, key)}
+        row.update(
+            n_seeds=int(n_seeds[i]), n_instances=int(instances[i]),
+            mean=float(mean[i]), var=float(var[i]), ci_low=float(ci_low[i]), ci_high=float(ci_high[i]),
+        )
+        table.append(row)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and aggregate LongPiBench results.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Compact results files into a columnar store.")
+    ingest_parser.add_argument("res_root", nargs="?", default="res")
+    ingest_parser.add_argument("--out", default=os.path.join("res", "_store"))
+    summary_parser = subparsers.add_parser("summary", help="Per-level mean, variance and bootstrap CI across random seeds.")
+    summary_parser.add_argument("store_dir", nargs="?", default=os.path.join("res", "_store"))
+    summary_parser.add_argument("--by", nargs="+", default=["task", "model", "variant", "type", "token_level", "level"])
+    summary_parser.add_argument("--n-boot", type=int, default=1000)
+    summary_parser.add_argument("--ci", type=float, default=0.95)
+    summary_parser.add_argument("--task", default=None)
+    summary_parser.add_argument("--model", default=None)
+    summary_parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        print(f"Ingested {ingest_results(args.res_root, args.out)} results into {args.out}.")
+        return
+
+    filters = {name: value for name, value in (("task", args.task), ("model", args.model)) if value is not None}
+    table = aggregate(ResultStore(args.store_dir), by=tuple(args.by), n_boot=args.n_boot, ci=args.ci, **filters)
+    if args.format == "json":
+        print(json.dumps(table, indent=4))
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(args.by) + ["n_seeds", "n_instances", "mean", "var", "ci_low", "ci_high"])
+        writer.writeheader()
+        writer.writerows(table)
+
+
+if __name__ == "__main__":
+    main()